@@ -1,7 +1,12 @@
 from flask import Flask, render_template
-from routes import api_blueprint
+from routes import (
+    api_blueprint, start_chat_session_expiry, start_search_cache_sync, start_update_expiry, start_update_feed
+)
 from flask_cors import CORS
 from payment_routes import payment_bp
+from search_engine import warm_search_engine
+from database import init_pool
+from migrations import migrate_database
 
 # Initialize Flask App
 app = Flask(__name__, template_folder="templates")
@@ -10,11 +15,33 @@ CORS(app)
 # Configure database (Example: SQLite)
 app.config.from_pyfile('config.py')
 
+# Check database connections out of a shared pool, one per request
+init_pool(app)
+
 # Register API routes from routes.py
 app.register_blueprint(api_blueprint)
 
 # Register payment routes from payment_routes.py
 app.register_blueprint(payment_bp)
 
+# Add any missing columns and indexes before the first query runs; a no-op in
+# workers forked by serve.py, whose arbiter has already migrated
+migrate_database()
+
+# Build the in-memory agency index and snapshot catalog once at startup
+warm_search_engine()
+
+# Expire old donation updates in the background rather than on each search; one worker runs it
+start_update_expiry()
+
+# Drop idle donation chats from the shared session table; one worker runs it
+start_chat_session_expiry()
+
+# Feed donation updates from every worker to this worker's /updates/stream clients
+start_update_feed()
+
+# Drop cached searches that other workers' donation updates made stale
+start_search_cache_sync()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
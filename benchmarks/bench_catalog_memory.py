@@ -0,0 +1,135 @@
+"""
+Measures the search catalog's memory and the allocations made per search, with
+tracemalloc, next to the namedtuple-per-row catalog it replaced.
+
+Rows come from an in-memory SQLite copy of agency_snapshots filled with
+synthetic agencies, so every string arrives as a fresh object the way it does
+from the real database.
+
+Usage: python benchmarks/bench_catalog_memory.py [agencies]
+"""
+import gc
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tracemalloc
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from search_engine import SNAPSHOT_COLUMNS, AgencyCatalog, SearchEngine, SearchQuery, map_marker  # noqa: E402
+from spatial_index import AgencyIndex  # noqa: E402
+
+# Center of the Capital Area Food Bank service region
+ORIGIN = (38.9072, -77.0369)
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MODELS = ["Walk up", "Home Delivery", "Drive thru", "Client choice"]
+FORMATS = ["Loose groceries", "Prepared meals", "Pre-packed bags"]
+SERVICES = ["Case management", "SNAP assistance", "Job training", "Health screenings"]
+CULTURES = ["East African", "Latin American", "East Asian", "West African", "Middle Eastern/ North African"]
+
+# The layout before AgencyRecord: one namedtuple per row, JSON lists parsed per row
+Snapshot = namedtuple("Snapshot", SNAPSHOT_COLUMNS + ("home_delivery",))
+
+
+def synthetic_database(n, seed=0):
+    """An in-memory agency_snapshots table with one to three openings per agency."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE agency_snapshots ({', '.join(SNAPSHOT_COLUMNS)})")
+    coordinates = []
+    rows = []
+    for i in range(n):
+        agency_id = f"{i:05d}-SYN-01"
+        lat = ORIGIN[0] + rng.uniform(-0.75, 0.75)
+        lon = ORIGIN[1] + rng.uniform(-0.75, 0.75)
+        coordinates.append((agency_id, lat, lon))
+        services = json.dumps(sorted(rng.sample(SERVICES, rng.randint(0, 2))))
+        cultures = json.dumps(sorted(rng.sample(CULTURES, rng.randint(0, 3))))
+        for day in rng.sample(DAYS, rng.randint(1, 3)):
+            start = rng.choice(["09:00:00.000000", "10:00:00.000000", "12:00:00.000000"])
+            rows.append((
+                len(rows) + 1, agency_id, day, day.lower(), f"Agency {i}", "Shopping Partner",
+                f"{i} Main St NW Washington DC", "(202) 555-0100", lat, lon, start, "14:00:00.000000",
+                "Every week", rng.choice(MODELS), rng.choice(FORMATS), rng.random() < 0.2,
+                None, services, cultures, f"Agency {i}", f"{i} Main St NW Washington DC", "9:00 AM to 2:00 PM",
+            ))
+    conn.executemany(f"INSERT INTO agency_snapshots VALUES ({', '.join('?' * len(SNAPSHOT_COLUMNS))})", rows)
+    return conn, coordinates
+
+
+def previous_catalog(rows):
+    """Snapshot namedtuples grouped by agency, as the catalog was built before AgencyRecord."""
+    catalog = {}
+    for row in rows:
+        values = dict(zip(SNAPSHOT_COLUMNS, row))
+        values["wraparound_services"] = json.loads(values["wraparound_services"] or "[]")
+        values["cultures_served"] = json.loads(values["cultures_served"] or "[]")
+        values["home_delivery"] = "Home Delivery" in (values["distribution_model"] or "")
+        catalog.setdefault(values["agency_id"], []).append(Snapshot(**values))
+    return catalog
+
+
+def catalog_bytes(conn, build=AgencyCatalog.from_rows):
+    """(catalog, bytes it holds once the fetched rows are gone)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = conn.execute(f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM agency_snapshots ORDER BY id").fetchall()
+    catalog = build(rows)
+    del rows
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return catalog, size
+
+
+def search_allocations(engine, queries):
+    """Mean bytes retained by each search's result, and mean peak allocated while it runs."""
+    retained, peaks = [], []
+    # Warm up once so first-call allocations aren't charged to the measured queries
+    for query in queries:
+        engine.search(query, map_marker)
+    tracemalloc.start()
+    for query in queries:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        page = engine.search(query, map_marker)
+        current, peak = tracemalloc.get_traced_memory()
+        retained.append(current - before)
+        peaks.append(peak - before)
+        del page
+    tracemalloc.stop()
+    return statistics.mean(retained), statistics.mean(peaks)
+
+
+def main(n):
+    conn, coordinates = synthetic_database(n)
+    previous, previous_size = catalog_bytes(conn, previous_catalog)
+    del previous
+    catalog, size = catalog_bytes(conn)
+    index = AgencyIndex.from_rows(coordinates)
+    engine = SearchEngine(index, catalog)
+
+    rng = random.Random(1)
+    origins = [(ORIGIN[0] + rng.uniform(-0.5, 0.5), ORIGIN[1] + rng.uniform(-0.5, 0.5)) for _ in range(200)]
+    queries = [SearchQuery(lat, lng, 5.0) for lat, lng in origins]
+    matches = statistics.mean(len(engine.search(query, map_marker).agencies) for query in queries)
+    retained, peak = search_allocations(engine, queries)
+
+    print(f"agencies: {n}, snapshot rows: {catalog.size}")
+    print(f"previous catalog:     {previous_size / 1e6:.2f} MB, {previous_size / n:.0f} bytes per agency, "
+          f"{previous_size / catalog.size:.0f} per row")
+    print(f"catalog:              {size / 1e6:.2f} MB, {size / n:.0f} bytes per agency, {size / catalog.size:.0f} per row")
+    print(f"                      {previous_size / size:.1f}x smaller")
+    print(f"per /search (5 mi, {matches:.0f} matches):")
+    print(f"  retained by result: {retained / 1e3:.1f} KB, {retained / matches:.0f} bytes per agency")
+    print(f"  peak while running: {peak / 1e3:.1f} KB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,60 @@
+"""
+Compares per-row geopy geodesic distances with the batched haversine engine.
+
+Usage: python benchmarks/bench_distance.py [sizes...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from distance import haversine_miles  # noqa: E402
+
+# Center of the Capital Area Food Bank service region
+ORIGIN = (38.9072, -77.0369)
+
+
+def random_agencies(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = ORIGIN[0] + rng.uniform(-0.75, 0.75, n)
+    lons = ORIGIN[1] + rng.uniform(-0.75, 0.75, n)
+    return lats, lons
+
+
+def time_geodesic(lats, lons):
+    start = time.perf_counter()
+    for lat, lon in zip(lats.tolist(), lons.tolist()):
+        geodesic(ORIGIN, (lat, lon)).miles
+    return time.perf_counter() - start
+
+
+def time_haversine(lats, lons, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        haversine_miles(ORIGIN[0], ORIGIN[1], lats, lons)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes):
+    print(f"{'agencies':>10} {'geodesic s':>12} {'haversine s':>12} {'rows/s geodesic':>16} {'rows/s haversine':>17} {'speedup':>9}")
+    for n in sizes:
+        lats, lons = random_agencies(n)
+        slow = time_geodesic(lats, lons)
+        fast = time_haversine(lats, lons)
+        print(f"{n:>10} {slow:>12.4f} {fast:>12.6f} {n / slow:>16,.0f} {n / fast:>17,.0f} {slow / fast:>8.0f}x")
+
+    # Accuracy of the spherical model against the ellipsoid on the largest sample
+    lats, lons = random_agencies(min(sizes[-1], 10_000))
+    exact = np.array([geodesic(ORIGIN, (lat, lon)).miles for lat, lon in zip(lats, lons)])
+    approx = haversine_miles(ORIGIN[0], ORIGIN[1], lats, lons)
+    print(f"max relative error: {np.max(np.abs(approx - exact) / exact):.4%}")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1_000, 10_000, 100_000])
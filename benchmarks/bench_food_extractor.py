@@ -0,0 +1,96 @@
+"""
+Measures the local food extractor against a corpus of donation messages.
+
+Reports per-message latency, how many messages it is confident enough to
+answer without Gemini, and how often its answer agrees with the reference.
+The reference is the hand-labelled corpus by default, or the Gemini
+extraction used by donate_chat with --live (needs config.py and a
+GEMINI_API_KEY).
+
+Usage: python benchmarks/bench_food_extractor.py [--live] [--corpus PATH]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from food_extractor import extract_donation, singular  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(__file__), "donation_messages.jsonl")
+
+
+def fold(item):
+    return " ".join(singular(word) for word in item.lower().split())
+
+
+def agrees(items, zip_code, reference):
+    """Same ZIP and a one-to-one match of items, where one item's text contains the other's."""
+    if zip_code != reference["zip_code"]:
+        return False
+    expected = [fold(item) for item in reference["food_items"]]
+    found = [fold(item) for item in items]
+    if len(expected) != len(found):
+        return False
+    return all(any(e in f or f in e for f in found) for e in expected)
+
+
+def time_local(messages, repeat=200):
+    """Median and p99 of the best-of-`repeat` latency per message, in microseconds."""
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            extract_donation(message)
+        timings.append((time.perf_counter() - start) / repeat * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--live", action="store_true", help="compare against Gemini instead of the labels")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    gemini_seconds = []
+    if args.live:
+        from routes import gemini_extract
+
+        for entry in corpus:
+            start = time.perf_counter()
+            items, zip_code = gemini_extract(entry["message"])
+            gemini_seconds.append(time.perf_counter() - start)
+            entry["food_items"], entry["zip_code"] = items, zip_code
+
+    confident = agreed = agreed_confident = 0
+    for entry in corpus:
+        extraction = extract_donation(entry["message"])
+        items = [str(item) for item in extraction.food_items]
+        matches = agrees(items, extraction.zip_code, entry)
+        agreed += matches
+        if extraction.confident:
+            confident += 1
+            agreed_confident += matches
+            if not matches:
+                print(f"  disagree: {entry['message']!r} -> {items} {extraction.zip_code}")
+
+    median, p99 = time_local([entry["message"] for entry in corpus])
+    reference = "Gemini" if args.live else "labels"
+    print(f"messages:                    {len(corpus)}")
+    print(f"local latency median / p99:  {median:.1f} / {p99:.1f} us")
+    if gemini_seconds:
+        print(f"Gemini latency median:       {statistics.median(gemini_seconds) * 1000:.0f} ms")
+    print(f"handled locally:             {confident} ({confident / len(corpus):.0%})")
+    print(f"agreement with {reference}, local: {agreed_confident}/{confident}")
+    print(f"agreement with {reference}, all:   {agreed}/{len(corpus)}")
+
+
+if __name__ == "__main__":
+    main()
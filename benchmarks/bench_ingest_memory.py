@@ -0,0 +1,94 @@
+"""
+Compares peak memory of loading an hours sheet whole with pd.read_excel against
+streaming it in chunks through sheet_reader.
+
+Each mode runs in its own process so its peak RSS is measured in isolation.
+
+Usage: python benchmarks/bench_ingest_memory.py [rows...]
+"""
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+HEADER = [
+    "External ID", "Name", "Shipping Address", "Phone", "Day of Week", "Starting Time",
+    "Ending Time", "Monthly Options", "By Appointment Only", "Distribution Models",
+    "Food Format ", "Food Pantry Requirements",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def write_sheet(path, rows, seed=0):
+    """Writes a synthetic shopping-partner hours sheet with `rows` rows."""
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for i in range(rows):
+        agency = i // 3
+        sheet.append([
+            f"{agency:05d}-PART-01", f"Partner {agency}", f"{agency} Main St Washington DC 20001",
+            "202-555-0100", DAYS[i % 7], f"{rng.randint(7, 11):02d}:00 AM", f"{rng.randint(1, 6):02d}:00 PM",
+            "Every week", rng.choice(["Yes", "No"]), "Client choice", "Shopping", "Photo ID",
+        ])
+    workbook.save(path)
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def to_records(df):
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def run_mode(mode, path):
+    """Reads `path` the way `mode` does, then prints rows, seconds and peak RSS."""
+    import pandas as pd
+
+    from sheet_reader import iter_chunks
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    rows = 0
+    if mode == "eager":
+        records = to_records(pd.read_excel(path))
+        rows = len(records)
+    else:
+        for df in iter_chunks(path):
+            rows += len(to_records(df))
+    elapsed = time.perf_counter() - start
+    print(rows, elapsed, peak_rss_mb() - baseline)
+
+
+def main(sizes):
+    print(f"{'rows':>8} {'mode':>7} {'seconds':>9} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"hours_{n}.xlsx")
+            write_sheet(path, n)
+            for mode in ("eager", "stream"):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--mode", mode, path],
+                    check=True, capture_output=True, text=True,
+                ).stdout.split()
+                rows, elapsed, peak = int(output[0]), float(output[1]), float(output[2])
+                assert rows == n, f"{mode} read {rows} of {n} rows"
+                print(f"{n:>8} {mode:>7} {elapsed:>9.2f} {peak:>14.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--mode":
+        run_mode(sys.argv[2], sys.argv[3])
+    else:
+        main([int(n) for n in sys.argv[1:]] or [10_000, 50_000])
@@ -0,0 +1,91 @@
+"""
+Times SearchEngine.search on a synthetic catalog, with and without a limit.
+
+Without a limit every agency in the radius is gathered and sorted; with one
+the index is searched ring by ring until the page is settled.
+
+Each agency gets a few openings on random days, with random facets; queries come from random
+origins in the service region. Needs no database.
+
+Usage: python benchmarks/bench_search_engine.py [agencies] [radius]
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from search_engine import AgencyCatalog, SearchEngine, SearchQuery, map_marker  # noqa: E402
+from spatial_index import AgencyIndex  # noqa: E402
+
+# Center of the Capital Area Food Bank service region
+ORIGIN = (38.9072, -77.0369)
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+CULTURES = ["East African", "Latin American", "East Asian", "West African", "Middle Eastern/ North African"]
+SERVICES = ["Case management", "Housing", "ESL", "Legal services"]
+
+
+def synthetic_engine(n, seed=0):
+    rng = random.Random(seed)
+    ids, lats, lons, rows = [], [], [], []
+    for i in range(n):
+        agency_id = f"{i:05d}-SYN-01"
+        lat = ORIGIN[0] + rng.uniform(-0.75, 0.75)
+        lon = ORIGIN[1] + rng.uniform(-0.75, 0.75)
+        ids.append(agency_id)
+        lats.append(lat)
+        lons.append(lon)
+        services = json.dumps(sorted(rng.sample(SERVICES, rng.randint(0, 2))))
+        cultures = json.dumps(sorted(rng.sample(CULTURES, rng.randint(0, 2))))
+        for day in rng.sample(DAYS, rng.randint(1, 3)):
+            model = rng.choice(["Walk up", "Home Delivery", "Drive thru"])
+            food_format = rng.choice(["Loose groceries", "Prepared meals"])
+            rows.append((
+                len(rows) + 1, agency_id, day, day.lower(), f"Agency {i}", "Pantry", f"{i} Main St", None, lat, lon,
+                "09:00:00.000000", "12:00:00.000000", "Every week", model, food_format, rng.random() < 0.3,
+                None, services, cultures, f"Agency {i}", f"{i} Main St", "9:00 AM to 12:00 PM",
+            ))
+    return SearchEngine(AgencyIndex(ids, lats, lons), AgencyCatalog.from_rows(rows))
+
+
+def time_queries(engine, queries):
+    """Median and p99 latency in milliseconds."""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        engine.search(query, map_marker)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main(n, radius):
+    engine = synthetic_engine(n)
+    rng = random.Random(1)
+    origins = [(ORIGIN[0] + rng.uniform(-0.5, 0.5), ORIGIN[1] + rng.uniform(-0.5, 0.5)) for _ in range(500)]
+    matches = statistics.mean(
+        len(engine.search(SearchQuery(lat, lng, radius), map_marker).agencies) for lat, lng in origins
+    )
+    print(f"agencies: {n}, snapshot rows: {engine.catalog.size}, radius: {radius} mi, mean matches: {matches:.0f}")
+
+    print(f"{'query':<32} {'median ms':>10} {'p99 ms':>8}")
+    for label, options in (
+        ("any day, all matches", {}),
+        ("any day, limit 10", {"limit": 10}),
+        ("any day, limit 20", {"limit": 20}),
+        ("Monday + home delivery", {"day": "Monday", "home_delivery": True}),
+        ("Monday, limit 10", {"day": "Monday", "limit": 10}),
+        ("walk-in + prepared meals", {"walk_in": True, "prepared_meals": True}),
+        ("Saturday + Latin American", {"day": "Saturday", "cultures": ("Latin American",)}),
+        ("ESL + Housing, limit 10", {"services": ("ESL", "Housing"), "limit": 10}),
+    ):
+        queries = [SearchQuery(lat, lng, radius, **options) for lat, lng in origins]
+        median, p99 = time_queries(engine, queries)
+        print(f"{label:<32} {median:>10.3f} {p99:>8.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000, float(sys.argv[2]) if len(sys.argv) > 2 else 5.0)
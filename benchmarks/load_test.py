@@ -0,0 +1,72 @@
+"""
+Measures throughput and latency of one endpoint at increasing concurrency.
+
+Start the server first (python serve.py, or python app.py for comparison), then:
+    python benchmarks/load_test.py "http://localhost:5000/expertquery?address={n} Main St, Washington, DC&day_of_week=Monday"
+
+"{n}" in the URL becomes a different number on every request. Worker
+concurrency only matters while requests wait on an upstream, and a repeated
+address is answered from the geocode cache, or from the bundled ZIP table
+for a ZIP code. Distinct street addresses make every request wait on a real
+Google Geocoding call, which counts against the API key's quota.
+
+Options: --levels 1,10,50,100,200  --requests 400  --start N (first "{n}"; random by default)
+"""
+import argparse
+import itertools
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_local = threading.local()
+
+
+def fetch(url):
+    # One keep-alive session per client thread
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    start = time.perf_counter()
+    try:
+        ok = session.get(url, timeout=60).status_code < 500
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_level(url, concurrency, total, numbers):
+    urls = [url.replace("{n}", str(next(numbers))) for _ in range(total)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return total / elapsed, statistics.median(latencies), p99, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("--levels", default="1,10,50,100,200")
+    parser.add_argument("--requests", type=int, default=400)
+    # A fresh start keeps addresses cached by an earlier run out of the measurement
+    parser.add_argument("--start", type=int, default=random.randrange(1000, 100000))
+    args = parser.parse_args()
+    numbers = itertools.count(args.start)
+
+    print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency in [int(level) for level in args.levels.split(",")]:
+        total = max(args.requests, concurrency)
+        rps, p50, p99, errors = run_level(args.url, concurrency, total, numbers)
+        print(f"{concurrency:>11} {rps:>9.1f} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
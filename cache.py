@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get() on a miss, so cached None values can be told apart
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after being stored."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (value, expires_at), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def evict_if(self, predicate):
+        """Removes every entry whose value satisfies `predicate` and returns how many were removed."""
+        with self._lock:
+            keys = [key for key, (value, _) in self._data.items() if predicate(value)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class _Call:
+    """A computation in progress whose outcome is shared with every waiter."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CoalescingCache(TTLCache):
+    """TTLCache whose get_or_compute() runs one computation per key, however many callers miss at once."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        super().__init__(maxsize, ttl)
+        self.coalesced = 0
+        self._inflight = {}  # key -> _Call
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for `key`, or calls `compute()` and caches its result.
+
+        Callers that miss while the same key is already being computed wait for
+        that result instead of starting their own; if it raises, they all raise.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        with self._lock:
+            # The value may have landed between the miss above and taking the lock
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = compute()
+            self.set(key, call.value)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+    def stats(self):
+        return dict(super().stats(), coalesced=self.coalesced)
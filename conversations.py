@@ -0,0 +1,150 @@
+"""
+Donation chat conversations, kept in the shared database's chat_sessions table.
+
+Gunicorn runs several workers and a donor's turns can land on any of them, so
+each turn loads the conversation by session ID and saves it back, rather than
+keeping it in one process's memory.
+"""
+import json
+import re
+import secrets
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+import config
+from database import get_connection
+from food_extractor import extract_donation
+
+CHAT_SESSION_TTL = getattr(config, "CHAT_SESSION_TTL", 30 * 60)  # idle seconds before a conversation is dropped
+CHAT_SESSION_PURGE_INTERVAL = getattr(config, "CHAT_SESSION_PURGE_INTERVAL", 600)
+CHAT_WINDOW_MESSAGES = getattr(config, "CHAT_WINDOW_MESSAGES", 6)  # recent messages replayed verbatim
+SUMMARY_MAX_ITEMS = 20
+
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+class Conversation:
+    """
+    One donor's chat: the last few messages verbatim plus a running summary of
+    everything older, so the prompt sent to Gemini stays the same size however
+    long the conversation runs.
+    """
+
+    def __init__(self, window=CHAT_WINDOW_MESSAGES):
+        self.recent = deque()  # (role, content), oldest first
+        self.window = window
+        self.food_items = []  # offered in messages that left the window
+        self.zip_code = None
+        self.earlier_messages = 0
+        self.lock = threading.Lock()
+
+    def add(self, role, content):
+        """Appends a message ("user" or "model"), folding the oldest into the summary past the window."""
+        with self.lock:
+            self.recent.append((role, content))
+            while len(self.recent) > self.window:
+                self._summarize(*self.recent.popleft())
+
+    def _summarize(self, role, content):
+        self.earlier_messages += 1
+        if role != "user":
+            return
+        extraction = extract_donation(content)
+        for item in extraction.food_items:
+            name = str(item)
+            if name not in self.food_items and len(self.food_items) < SUMMARY_MAX_ITEMS:
+                self.food_items.append(name)
+        self.zip_code = extraction.zip_code or self.zip_code
+
+    def summary(self):
+        """One line describing the messages no longer in the window, or None if there are none."""
+        if not self.earlier_messages:
+            return None
+        facts = [f"{self.earlier_messages} earlier messages were exchanged"]
+        if self.food_items:
+            facts.append(f"the user offered to donate {', '.join(self.food_items)}")
+        if self.zip_code:
+            facts.append(f"their ZIP code is {self.zip_code}")
+        return "Summary of the conversation so far: " + "; ".join(facts) + "."
+
+    def snapshot(self):
+        """(summary, recent messages) as of now, safe to use while other requests add messages."""
+        with self.lock:
+            return self.summary(), list(self.recent)
+
+    def to_json(self):
+        with self.lock:
+            return json.dumps({
+                "recent": list(self.recent),
+                "food_items": self.food_items,
+                "zip_code": self.zip_code,
+                "earlier_messages": self.earlier_messages,
+            })
+
+    @classmethod
+    def from_json(cls, text, window=CHAT_WINDOW_MESSAGES):
+        state = json.loads(text)
+        conversation = cls(window)
+        conversation.recent.extend((role, content) for role, content in state["recent"])
+        conversation.food_items = state["food_items"]
+        conversation.zip_code = state["zip_code"]
+        conversation.earlier_messages = state["earlier_messages"]
+        return conversation
+
+
+class ConversationStore:
+    """Conversations by session ID in the chat_sessions table, dropped after CHAT_SESSION_TTL idle seconds."""
+
+    def __init__(self, ttl=CHAT_SESSION_TTL, window=CHAT_WINDOW_MESSAGES):
+        self.ttl = timedelta(seconds=ttl)
+        self.window = window
+        self.loaded = self.started = self.saved = 0
+
+    def get(self, session_id=None, history=()):
+        """
+        Returns (session_id, conversation), starting a new one for a missing or expired ID.
+
+        A new conversation is seeded with the tail of `history`, for clients that
+        still send the whole transcript.
+        """
+        row = None
+        if session_id and SESSION_ID_RE.match(session_id):
+            with get_connection() as conn:
+                row = conn.execute(
+                    "SELECT state FROM chat_sessions WHERE session_id = ? AND updated_at >= ?",
+                    (session_id, datetime.now() - self.ttl)
+                ).fetchone()
+        else:
+            session_id = secrets.token_urlsafe(16)
+
+        if row is not None:
+            self.loaded += 1
+            return session_id, Conversation.from_json(row[0], self.window)
+
+        self.started += 1
+        conversation = Conversation(self.window)
+        for message in list(history)[-self.window:]:
+            role = "user" if message.get("role") == "user" else "model"
+            conversation.add(role, str(message.get("content", "")))
+        return session_id, conversation
+
+    def save(self, session_id, conversation):
+        """Stores the conversation for the donor's next turn, on whichever worker it lands; restarts its TTL."""
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, conversation.to_json(), datetime.now())
+            )
+            conn.commit()
+        self.saved += 1
+
+    def purge(self):
+        """Deletes conversations idle longer than the TTL; returns how many."""
+        with get_connection() as conn:
+            cursor = conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (datetime.now() - self.ttl,))
+            conn.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        return {"loaded": self.loaded, "started": self.started, "saved": self.saved}
@@ -1,120 +1,462 @@
+import argparse
+import hashlib
+import json
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time
+
 import pandas as pd
 import requests
 from config import API_KEY # Ensure you have your API key in a config file or environment variable
-from datetime import datetime, time
-from models import Agency, HoursOfOperation, WraparoundService, CultureServed
+from models import Agency, HoursOfOperation, WraparoundService, CultureServed, AgencySnapshot, IngestionWatermark
+from sqlalchemy import inspect, or_, text
 
+from cache import MISSING
 from database import init_db, session
+from geocode_cache import GeocodeCache
+from migrations import migrate, normalize_day
+from sheet_reader import iter_chunks
+from voice_summary import display_columns
+
+# Rows read per spreadsheet chunk and written per bulk insert, each committed as its own transaction
+CHUNK_SIZE = 500
+
+# Concurrent requests to the geocoding API
+GEOCODE_WORKERS = 8
+
+# Shared with the web app's cache file, so addresses geocoded once are never fetched again
+geocode_cache = GeocodeCache()
+
+# ========== SOURCES ==========
+# Hours-of-operation sheets also define the agencies themselves
+HOURS_SHEETS = [
+    {
+        "path": 'data/CAFB_Markets_HOO.xlsx',
+        "type": 'market',
+        "id": 'Agency ID',
+        "name": 'Agency Name',
+        "phone": None,
+        "frequency": 'Frequency',
+        "appointment_only": None,  # No such field in this sheet
+    },
+    {
+        "path": 'data/CAFB_Shopping_Partners_HOO.xlsx',
+        "type": 'shopping_partner',
+        "id": 'External ID',
+        "name": 'Name',
+        "phone": 'Phone',
+        "frequency": 'Monthly Options',
+        "appointment_only": 'By Appointment Only',
+    },
+]
+
+# Hours fields that identify a row when diffing against the database
+HOURS_FIELDS = (
+    "agency_id", "day_of_week", "start_time", "end_time", "frequency",
+    "distribution_model", "food_format", "pantry_requirements", "appointment_only",
+)
+
+# (path, model, {model column: sheet column})
+DETAIL_SHEETS = [
+    ('data/CAFB_Markets_Wraparound_Services.xlsx', WraparoundService,
+     {"agency_id": 'Agency ID', "service": 'Wraparound Service'}),
+    ('data/CAFB_Markets_Cultures_Served.xlsx', CultureServed,
+     {"agency_id": 'Agency ID', "cultures": 'Cultural Populations Served'}),
+    ('data/CAFB_Shopping_Partners_Wraparound_Services.xlsx', WraparoundService,
+     {"agency_id": 'Agency ID', "service": 'Wraparound Service'}),
+    ('data/CAFB_Shopping_Partners_Cultures_Served.xlsx', CultureServed,
+     {"agency_id": 'Agency ID', "cultures": 'Cultural Populations Served'}),
+]
+
 
 def get_lat_lon(address):
+    cached = geocode_cache.get("google", address)
+    if cached is not MISSING:
+        return cached if cached else (None, None)
+
     api_key = API_KEY
-    
+
     url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={api_key}"
-    
+
     response = requests.get(url)
     data = response.json()
-    
+
     if data["status"] == "OK":
         location = data["results"][0]["geometry"]["location"]
+        geocode_cache.set("google", address, (location["lat"], location["lng"]))
         return location["lat"], location["lng"]
+    if data["status"] == "ZERO_RESULTS":
+        geocode_cache.set("google", address, None)
     return None, None
 
-# Step 1: Initialize DB (create tables if they don’t exist)
-init_db()
+
+def geocode_addresses(addresses):
+    """Geocodes each distinct address once, GEOCODE_WORKERS at a time. Returns {address: (lat, lon)}."""
+    unique = list(dict.fromkeys(a for a in addresses if isinstance(a, str) and a.strip()))
+    with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as pool:
+        return dict(zip(unique, pool.map(get_lat_lon, unique)))
+
 
 # Helpers
-def parse_time(time_str):
-    """Converts a time string to a `datetime.time` object if valid, otherwise returns None."""
-    if isinstance(time_str, time):  # If it's already a time object, return it
-        return time_str
-    elif isinstance(time_str, str):  # If it's a string, check if it's a valid time
-        time_str = time_str.strip()
-        try:
-            return datetime.strptime(time_str, "%I:%M %p").time()
-        except ValueError:  # If parsing fails, return None (or handle differently)
-            return None
-    else:
-        return None  # Handle unexpected types
-
-
-def parse_bool(val):
-    if isinstance(val, str):
-        return val.strip().lower() == 'yes'
-    return bool(val)
-
-# ========== MARKETS ==========
-df_markets_hoo = pd.read_excel('data/CAFB_Markets_HOO.xlsx')
-for _, row in df_markets_hoo.iterrows():
-    agency_id = row['Agency ID']
-    agency_name = row['Agency Name']
-    shipping_address = row['Shipping Address']
-    existing = session.query(Agency).filter_by(id=agency_id).first()
-    if not existing:
-        lat, lon = get_lat_lon(shipping_address)
-        agency = Agency(agency_id=agency_id, name=agency_name, type='market', address = shipping_address, phone=None, latitude=lat, longitude=lon)
-        session.add(agency)
-
-    hours = HoursOfOperation(
-        agency_id=agency_id,
-        day_of_week=row['Day of Week'],
-        start_time=parse_time(row['Starting Time']),
-        end_time=parse_time(row['Ending Time']),
-        frequency=row['Frequency'],
-        distribution_model=row.get('Distribution Models'),
-        food_format=row.get('Food Format '),
-        pantry_requirements=row.get('Food Pantry Requirements'),
-        appointment_only=None  # No such field in this sheet
-    )
-    session.add(hours)
-
-df_markets_services = pd.read_excel('data/CAFB_Markets_Wraparound_Services.xlsx')
-for _, row in df_markets_services.iterrows():
-    service = WraparoundService(agency_id=row['Agency ID'], service=row['Wraparound Service'])
-    session.add(service)
-
-df_markets_cultures = pd.read_excel('data/CAFB_Markets_Cultures_Served.xlsx')
-for _, row in df_markets_cultures.iterrows():
-    cultures = row['Cultural Populations Served']
-    entry = CultureServed(agency_id=row['Agency ID'], cultures=cultures)
-    session.add(entry)
-
-# ========== SHOPPING PARTNERS ==========
-df_sp_hoo = pd.read_excel('data/CAFB_Shopping_Partners_HOO.xlsx')
-for _, row in df_sp_hoo.iterrows():
-    agency_id = row['External ID']
-    agency_name = row['Name']
-    shipping_address = row['Shipping Address']
-    phone = row['Phone']
-    existing = session.query(Agency).filter_by(id=agency_id).first()
-    if not existing:
-        lat, lon = get_lat_lon(shipping_address)
-        agency = Agency(agency_id=agency_id, name=agency_name, type='shopping_partner', address = shipping_address, phone=phone, latitude=lat, longitude=lon)
-        session.add(agency)
-
-    hours = HoursOfOperation(
-        agency_id=agency_id,
-        day_of_week=row['Day of Week'],
-        start_time=parse_time(row['Starting Time']),
-        end_time=parse_time(row['Ending Time']),
-        frequency=row['Monthly Options'],
-        appointment_only=parse_bool(row['By Appointment Only']),
-        pantry_requirements=row.get('Food Pantry Requirements'),
-        distribution_model=row.get('Distribution Models'),
-        food_format=row.get('Food Format ')
+def parse_time_column(values):
+    """Converts a column of "HH:MM AM" strings to `datetime.time` objects; anything unparseable becomes None."""
+    is_time = values.map(lambda v: isinstance(v, time))
+    is_str = values.map(lambda v: isinstance(v, str))
+    parsed = pd.to_datetime(values.where(is_str).str.strip(), format="%I:%M %p", errors="coerce")
+    result = pd.Series(parsed.dt.time, index=values.index, dtype=object).where(parsed.notna(), None)
+    # Cells Excel already typed as times pass through untouched
+    return result.where(~is_time, values)
+
+
+def parse_bool_column(values):
+    """'yes' (any case or padding) is True for strings; other cells use their truthiness."""
+    is_str = values.map(lambda v: isinstance(v, str))
+    answers = values.where(is_str).str.strip().str.lower().eq('yes')
+    return answers.where(is_str, values.astype(bool)).astype(bool)
+
+
+def optional_column(df, name):
+    if name is not None and name in df:
+        return df[name]
+    return pd.Series(None, index=df.index, dtype=object)
+
+
+def to_records(df):
+    """DataFrame rows as dicts, with NaN/NaT turned into None for the database."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def add_missing_columns():
+    """create_all() never alters existing tables, so add columns introduced after they were created."""
+    engine = session.get_bind()
+    inspector = inspect(engine)
+    for model in (Agency, HoursOfOperation, WraparoundService, CultureServed):
+        existing = {column["name"] for column in inspector.get_columns(model.__tablename__)}
+        for column in model.__table__.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                session.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column_type}"))
+    session.commit()
+
+
+def migrate_schema():
+    """Runs migrations.py on the ingestion database, backfilling day keys and adding indexes."""
+    conn = session.get_bind().raw_connection()
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+
+
+def bulk_insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        session.bulk_insert_mappings(model, rows[start:start + CHUNK_SIZE])
+        session.commit()
+    return len(rows)
+
+
+def refresh_agency_snapshot(agency_ids=None):
+    """Rebuilds agency_snapshots (one row per agency opening) for `agency_ids`, or for every agency."""
+    agencies = session.query(Agency)
+    hours = session.query(HoursOfOperation).order_by(HoursOfOperation.id)
+    services = session.query(WraparoundService)
+    cultures = session.query(CultureServed)
+    snapshots = session.query(AgencySnapshot)
+    if agency_ids is not None:
+        agency_ids = list(agency_ids)
+        agencies = agencies.filter(Agency.agency_id.in_(agency_ids))
+        hours = hours.filter(HoursOfOperation.agency_id.in_(agency_ids))
+        services = services.filter(WraparoundService.agency_id.in_(agency_ids))
+        cultures = cultures.filter(CultureServed.agency_id.in_(agency_ids))
+        snapshots = snapshots.filter(AgencySnapshot.agency_id.in_(agency_ids))
+
+    snapshots.delete(synchronize_session=False)
+
+    # Collect services and cultures once per agency instead of once per joined row
+    services_by_agency = {}
+    for entry in services:
+        if entry.service:
+            services_by_agency.setdefault(entry.agency_id, set()).add(entry.service)
+    cultures_by_agency = {}
+    for entry in cultures:
+        if entry.cultures:
+            cultures_by_agency.setdefault(entry.agency_id, set()).add(entry.cultures)
+
+    hours_by_agency = {}
+    for entry in hours:
+        hours_by_agency.setdefault(entry.agency_id, []).append(entry)
+
+    rows = []
+    seen = set()
+    for agency in agencies:
+        if agency.agency_id in seen:
+            continue
+        seen.add(agency.agency_id)
+        wraparound = json.dumps(sorted(services_by_agency.get(agency.agency_id, ())))
+        served = json.dumps(sorted(cultures_by_agency.get(agency.agency_id, ())))
+        for entry in hours_by_agency.get(agency.agency_id, []):
+            rows.append({
+                "agency_id": agency.agency_id,
+                "day_of_week": entry.day_of_week,
+                "day_key": normalize_day(entry.day_of_week),
+                "name": agency.name,
+                "type": agency.type,
+                "address": agency.address,
+                "phone": agency.phone,
+                "latitude": agency.latitude,
+                "longitude": agency.longitude,
+                "start_time": entry.start_time,
+                "end_time": entry.end_time,
+                "frequency": entry.frequency,
+                "distribution_model": entry.distribution_model,
+                "food_format": entry.food_format,
+                "appointment_only": entry.appointment_only,
+                "pantry_requirements": entry.pantry_requirements,
+                "wraparound_services": wraparound,
+                "cultures_served": served,
+                **display_columns(agency.name, agency.address, entry.start_time, entry.end_time)
+            })
+    count = bulk_insert(AgencySnapshot, rows)
+    session.commit()  # also covers the delete when nothing was re-inserted
+    return count
+
+
+def hash_row(values):
+    """Stable fingerprint of a row's ingested values, used to detect changes between runs."""
+    payload = json.dumps([v.isoformat() if isinstance(v, time) else v for v in values], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def add_row_hashes(records, fields):
+    for record in records:
+        record["row_hash"] = hash_row(record[field] for field in fields)
+    return records
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_unchanged(path, digest):
+    watermark = session.get(IngestionWatermark, path)
+    return watermark is not None and watermark.file_hash == digest
+
+
+def record_watermark(path, digest):
+    session.merge(IngestionWatermark(path=path, file_hash=digest, synced_at=datetime.now()))
+    session.commit()
+
+
+def delete_by_id(model, ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        session.query(model).filter(model.id.in_(ids[start:start + CHUNK_SIZE])).delete(synchronize_session=False)
+        session.commit()
+
+
+def tag_source(model, ids, source):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        session.query(model).filter(model.id.in_(ids[start:start + CHUNK_SIZE])).update(
+            {model.source: source}, synchronize_session=False)
+        session.commit()
+
+
+def sync_rows(model, source, chunks):
+    """
+    Applies record batches (with row_hash set) to the rows stored for `source`.
+
+    Rows whose hash is unchanged are left alone and new ones are inserted as
+    each batch arrives; stored rows the sheet no longer has are deleted at the
+    end, so a changed row is an insert plus a delete. Rows from runs that
+    predate tracking (no source) are adopted if they match, and otherwise
+    replaced for agencies that appear in the sheet.
+    Returns the agency IDs whose rows changed.
+    """
+    # Only hashes and IDs of the stored rows are held, never the sheet itself
+    stored = {}
+    for row_id, agency_id, row_hash, row_source in session.query(
+            model.id, model.agency_id, model.row_hash, model.source).filter(
+            or_(model.source == source, model.source.is_(None))):
+        stored.setdefault(row_hash, []).append((row_id, agency_id, row_source is None))
+
+    seen_agency_ids, changed, adopted = set(), set(), []
+    inserted = unchanged = 0
+    for records in chunks:
+        inserts = []
+        for record in records:
+            seen_agency_ids.add(record["agency_id"])
+            matches = stored.get(record["row_hash"])
+            if matches:
+                row_id, _, legacy = matches.pop()
+                if legacy:
+                    adopted.append(row_id)
+                unchanged += 1
+            else:
+                inserts.append(dict(record, source=source))
+                changed.add(record["agency_id"])
+        inserted += bulk_insert(model, inserts)
+
+    stale = []
+    for matches in stored.values():
+        for row_id, agency_id, legacy in matches:
+            if not legacy or agency_id in seen_agency_ids:
+                stale.append(row_id)
+                changed.add(agency_id)
+
+    delete_by_id(model, stale)
+    tag_source(model, adopted, source)
+    print(f"{source}: {inserted} inserted, {len(stale)} deleted, {unchanged} unchanged")
+    return changed
+
+
+class AgencySync:
+    """
+    Syncs the agencies of one hours sheet as its rows stream in.
+
+    New agency IDs are inserted and changed ones updated per chunk; finish()
+    removes the agencies the sheet no longer lists.
+    """
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.seen = set()
+        self.changed = set()
+        self.inserted = self.updated = 0
+
+        # One query for every stored agency of this type instead of a lookup per spreadsheet row
+        self.stored, self.duplicates = {}, []
+        for row_id, agency_id, row_hash, address in session.query(
+                Agency.id, Agency.agency_id, Agency.row_hash, Agency.address).filter(Agency.type == sheet["type"]):
+            if agency_id in self.stored:
+                self.duplicates.append(row_id)  # left behind by older ingestion runs
+            else:
+                self.stored[agency_id] = (row_id, row_hash, address)
+
+    def apply(self, df):
+        sheet = self.sheet
+        # One agency per ID: the first row describes it
+        first_rows = df.drop_duplicates(subset=sheet["id"])
+        first_rows = first_rows[~first_rows[sheet["id"]].isin(self.seen)]
+        self.seen.update(first_rows[sheet["id"]])
+        records = add_row_hashes(to_records(pd.DataFrame({
+            "agency_id": first_rows[sheet["id"]],
+            "name": first_rows[sheet["name"]],
+            "type": sheet["type"],
+            "address": first_rows['Shipping Address'],
+            "phone": optional_column(first_rows, sheet["phone"]),
+        })), ("name", "type", "address", "phone"))
+
+        inserts, updates = [], []
+        for record in records:
+            existing = self.stored.pop(record["agency_id"], None)
+            if existing is None:
+                inserts.append(record)
+            elif existing[1] != record["row_hash"]:
+                record["id"] = existing[0]
+                record["moved"] = existing[2] != record["address"]
+                updates.append(record)
+
+        # Only new or moved agencies need coordinates
+        to_geocode = inserts + [record for record in updates if record.pop("moved")]
+        coords = geocode_addresses(record["address"] for record in to_geocode)
+        for record in to_geocode:
+            record["latitude"], record["longitude"] = coords.get(record["address"], (None, None))
+
+        self.inserted += bulk_insert(Agency, inserts)
+        if updates:
+            session.bulk_update_mappings(Agency, updates)
+            session.commit()
+        self.updated += len(updates)
+        self.changed.update(record["agency_id"] for record in inserts + updates)
+
+    def finish(self):
+        """Deletes agencies missing from the sheet and returns every agency ID that changed."""
+        delete_by_id(Agency, [row_id for row_id, _, _ in self.stored.values()] + self.duplicates)
+        print(f"{self.sheet['path']}: {self.inserted} new, {self.updated} changed, "
+              f"{len(self.stored)} removed agencies")
+        return self.changed | set(self.stored)
+
+
+def hours_frame(sheet, df):
+    return pd.DataFrame({
+        "agency_id": df[sheet["id"]],
+        "day_of_week": df['Day of Week'],
+        "day_key": df['Day of Week'].map(normalize_day),
+        "start_time": parse_time_column(df['Starting Time']),
+        "end_time": parse_time_column(df['Ending Time']),
+        "frequency": df[sheet["frequency"]],
+        "distribution_model": optional_column(df, 'Distribution Models'),
+        "food_format": optional_column(df, 'Food Format '),
+        "pantry_requirements": optional_column(df, 'Food Pantry Requirements'),
+        "appointment_only": (
+            parse_bool_column(df[sheet["appointment_only"]]) if sheet["appointment_only"]
+            else optional_column(df, None)
+        ),
+    })
+
+
+def sync_hours_sheet(sheet):
+    """Streams a sheet once, syncing its agencies and hours rows; returns the agency IDs that changed."""
+    agencies = AgencySync(sheet)
+
+    def hours_records():
+        for df in iter_chunks(sheet["path"], CHUNK_SIZE):
+            # Agencies first, so each chunk's hours rows never point at a missing agency
+            agencies.apply(df)
+            yield add_row_hashes(to_records(hours_frame(sheet, df)), HOURS_FIELDS)
+
+    changed = sync_rows(HoursOfOperation, sheet["path"], hours_records())
+    return changed | agencies.finish()
+
+
+def sync_detail_sheet(path, model, columns):
+    """Streams service/culture rows into the database; returns the agency IDs that changed."""
+    chunks = (
+        add_row_hashes(to_records(pd.DataFrame({field: df[column] for field, column in columns.items()})),
+                       list(columns))
+        for df in iter_chunks(path, CHUNK_SIZE)
     )
-    session.add(hours)
-
-df_sp_services = pd.read_excel('data/CAFB_Shopping_Partners_Wraparound_Services.xlsx')
-for _, row in df_sp_services.iterrows():
-    service = WraparoundService(agency_id=row['Agency ID'], service=row['Wraparound Service'])
-    session.add(service)
-
-df_sp_cultures = pd.read_excel('data/CAFB_Shopping_Partners_Cultures_Served.xlsx')
-for _, row in df_sp_cultures.iterrows():
-    cultures = row['Cultural Populations Served']
-    entry = CultureServed(agency_id=row['Agency ID'], cultures=cultures)
-    session.add(entry)
-
-# Commit everything
-session.commit()
-session.close()
+    return sync_rows(model, path, chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the CAFB spreadsheets into the database.")
+    parser.add_argument("--force", action="store_true", help="diff every sheet even if its file is unchanged")
+    args = parser.parse_args()
+
+    started = timer.perf_counter()
+
+    # Step 1: Initialize DB (create tables if they don’t exist)
+    init_db()
+    add_missing_columns()
+    migrate_schema()
+
+    # Agencies changed by this run, whose snapshot rows get rebuilt at the end
+    touched_agency_ids = set()
+
+    # (path, sync function, its arguments); hours sheets go first so new agencies exist before their details
+    sources = [(sheet["path"], sync_hours_sheet, (sheet,)) for sheet in HOURS_SHEETS]
+    sources += [(path, sync_detail_sheet, (path, model, columns)) for path, model, columns in DETAIL_SHEETS]
+
+    # ========== MARKETS & SHOPPING PARTNERS ==========
+    for path, sync, sync_args in sources:
+        digest = file_hash(path)
+        if not args.force and is_unchanged(path, digest):
+            print(f"{path}: unchanged, skipped")
+            continue
+        touched_agency_ids |= sync(*sync_args)
+        record_watermark(path, digest)
+
+    # ========== AGENCY SNAPSHOT ==========
+    snapshot_rows = refresh_agency_snapshot(touched_agency_ids)
+    print(f"Refreshed {snapshot_rows} agency snapshot rows for {len(touched_agency_ids)} agencies")
+
+    session.close()
+    print(f"Ingestion finished in {timer.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,243 @@
+import logging
+import threading
+import time
+from collections import deque
+
 import sqlitecloud
+from flask import g, has_app_context
+from sqlalchemy import create_engine
+from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
+
+import config
 from config import DATABASE_URL
 
+# Pool sizing and housekeeping, overridable from config.py
+POOL_MIN_SIZE = getattr(config, "DB_POOL_MIN_SIZE", 1)
+POOL_MAX_SIZE = getattr(config, "DB_POOL_MAX_SIZE", 10)
+POOL_TIMEOUT = getattr(config, "DB_POOL_TIMEOUT", 10)  # seconds to wait for a free connection
+POOL_IDLE_TIMEOUT = getattr(config, "DB_POOL_IDLE_TIMEOUT", 300)  # seconds before idle extras are closed
+POOL_HEALTH_CHECK_AFTER = getattr(config, "DB_POOL_HEALTH_CHECK_AFTER", 30)  # idle seconds before a ping
+
+# SQLAlchemy URL for the ORM (models.py, data_ingestion.py). sqlitecloud:// URLs need the
+# sqlalchemy-sqlitecloud dialect; a sqlite:/// URL works against a local copy of the database.
+SQLALCHEMY_DATABASE_URL = getattr(config, "SQLALCHEMY_DATABASE_URL", DATABASE_URL)
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+class PooledConnection:
+    """
+    A checked-out connection; close() hands it back to the pool instead of closing it.
+
+    Used as a context manager it goes back to the pool however the block
+    exits, rolled back if the block raised.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(exc)
+
+    def close(self):
+        self.release()
+
+    def release(self, error=None):
+        """Returns the connection to the pool; after an error it is rolled back, or discarded if that fails."""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if error is not None:
+            try:
+                conn.rollback()
+            except Exception:
+                self._pool.release(conn, discard=True)
+                return
+        self._pool.release(conn)
+
+
+class RequestConnection(PooledConnection):
+    """Connection shared by everything in one request, returned to the pool at teardown."""
+
+    def __exit__(self, exc_type, exc, tb):
+        # The checkout lives until the request ends, however the block exits
+        pass
+
+    def close(self):
+        # Routes close their connection when done; the checkout lives until the request ends
+        pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite Cloud connections with health checks and idle eviction."""
+
+    def __init__(self, url, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 idle_timeout=POOL_IDLE_TIMEOUT, health_check_after=POOL_HEALTH_CHECK_AFTER):
+        self.url = url
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._idle = deque()  # (connection, last_used) pairs, most recently used on the right
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def _open(self):
+        return sqlitecloud.connect(self.url)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logging.warning(f"Error closing pooled connection: {e}")
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Exception as e:
+            logging.warning(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def fill(self):
+        """Opens connections until the pool holds at least `min_size`."""
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                raise
+            self.release(conn)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                self._evict_idle()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhaustedError(f"No database connection available after {self.timeout}s")
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    return self._open()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+
+            # Only ping connections that sat idle long enough to have been dropped upstream
+            if time.monotonic() - last_used < self.health_check_after or self._is_healthy(conn):
+                return conn
+            self.release(conn, discard=True)
+
+    def release(self, conn, discard=False):
+        with self._condition:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+        if discard:
+            self._close(conn)
+
+    def _evict_idle(self):
+        """Closes connections idle past `idle_timeout` while keeping `min_size` open. Caller holds the lock."""
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._close(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(DATABASE_URL)
+                pool.fill()
+                _pool = pool
+    return _pool
+
 
 def get_connection():
-    return sqlitecloud.connect(DATABASE_URL)
+    """
+    Checks a connection out of the pool.
+
+    Inside a request every call returns the same connection, released when the
+    request ends. Elsewhere use it in a `with` block, which returns it to the
+    pool even if the block raises.
+    """
+    if has_app_context():
+        if "db_conn" not in g:
+            g.db_conn = RequestConnection(get_pool(), get_pool().acquire())
+        return g.db_conn
+    return PooledConnection(get_pool(), get_pool().acquire())
+
+
+def release_request_connection(error=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        conn.release(error)
+
+
+def init_pool(app):
+    """Returns each request's pooled connection when its app context tears down."""
+    app.teardown_appcontext(release_request_connection)
+
+
+# ----------------------------
+# SQLAlchemy ORM, used by models.py and data_ingestion.py; the web app reads through the pool above
+# ----------------------------
+
+Base = declarative_base()
+
+# Bound to the engine by init_db(), so importing models.py never needs a database
+session = scoped_session(sessionmaker())
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    return _engine
+
+
+def init_db():
+    """Binds `session` to SQLALCHEMY_DATABASE_URL and creates any tables models.py defines that are missing."""
+    import models  # noqa: F401  (registers the tables on Base)
+
+    engine = get_engine()
+    session.configure(bind=engine)
+    Base.metadata.create_all(engine)
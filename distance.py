@@ -0,0 +1,60 @@
+import numpy as np
+from geographiclib.geodesic import Geodesic
+from geopy.distance import ELLIPSOIDS
+
+# The WGS-84 solver geopy's geodesic() builds on every call, made once. Its
+# lengths are in kilometers, like geopy's.
+_MAJOR_KM, _, _FLATTENING = ELLIPSOIDS["WGS-84"]
+_WGS84 = Geodesic(_MAJOR_KM, _FLATTENING)
+KM_PER_MILE = 1.609344
+
+# Mean Earth radius used by the spherical (haversine) model
+EARTH_RADIUS_MILES = 3958.7613
+
+# Upper bound on the relative error of the spherical model against the WGS-84
+# ellipsoid that geodesic() uses. Distances closer than this to a radius
+# boundary are re-checked with the exact geodesic.
+HAVERSINE_MAX_ERROR = 0.0056
+
+
+def haversine_miles(lat, lon, lats, lons):
+    """Great-circle distances in miles from one point to arrays of points."""
+    lat1 = np.radians(lat)
+    lats = np.radians(np.asarray(lats, dtype=float))
+    dlat = lats - lat1
+    dlon = np.radians(np.asarray(lons, dtype=float) - lon)
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lats) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def geodesic_miles(lat1, lon1, lat2, lon2):
+    """Exact ellipsoidal distance in miles between two points; the same value as geopy's geodesic().miles."""
+    return _WGS84.Inverse(lat1, lon1, lat2, lon2, Geodesic.DISTANCE)["s12"] / KM_PER_MILE
+
+
+def distances_within(lat, lon, lats, lons, radius):
+    """
+    Returns (positions, distances) for the points within `radius` miles.
+
+    Distances are computed in one batch with haversine; only the few points
+    whose spherical distance is too close to the radius to be trusted are
+    measured again with geodesic() so membership matches the exact model.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    distances = haversine_miles(lat, lon, lats, lons)
+
+    slack = radius * HAVERSINE_MAX_ERROR
+    positions = np.flatnonzero(distances <= radius + slack)
+    distances = distances[positions]
+
+    borderline = np.flatnonzero(distances >= radius - slack)
+    if len(borderline):
+        for i in borderline:
+            p = positions[i]
+            distances[i] = geodesic_miles(lat, lon, lats[p], lons[p])
+        keep = distances <= radius
+        positions, distances = positions[keep], distances[keep]
+
+    return positions, distances
+
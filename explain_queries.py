@@ -0,0 +1,115 @@
+"""
+Runs EXPLAIN QUERY PLAN over every SQL statement executed in routes.py (or the
+given modules) and exits non-zero if any of them scans a whole table.
+
+Statements are found by reading the source, so nothing is executed against
+the data. Plans are checked on an in-memory copy of the database with
+migrations.py applied. f-string SQL may only interpolate sql_placeholders(),
+which is expanded to a few placeholders. Statements without a WHERE clause
+read every row by design and are allowed to scan.
+
+Usage: python explain_queries.py [--db food_assistance.db] [module.py ...]
+"""
+import argparse
+import ast
+import re
+import sqlite3
+import sys
+
+from migrations import migrate
+
+# Placeholders substituted for sql_placeholders(...) in f-string SQL
+IN_LIST_SIZE = 3
+
+SCAN_RE = re.compile(r"^SCAN (?!CONSTANT ROW)(\S+)")
+# Views and subqueries the plan builds itself; scanning their output is not a table scan
+DERIVED_RE = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\S+)")
+WHERE_RE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+
+def _render(node):
+    """SQL text of a string or f-string node, or None if it interpolates anything but sql_placeholders()."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if not isinstance(node, ast.JoinedStr):
+        return None
+
+    parts = []
+    for value in node.values:
+        if isinstance(value, ast.Constant):
+            parts.append(value.value)
+        elif (isinstance(value, ast.FormattedValue) and isinstance(value.value, ast.Call)
+              and getattr(value.value.func, "id", None) == "sql_placeholders"):
+            parts.append(", ".join("?" * IN_LIST_SIZE))
+        else:
+            return None
+    return "".join(parts)
+
+
+def find_statements(path):
+    """Yields (line, sql) for each execute() call in a module; sql is None when it can't be rendered."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ("execute", "executemany") and node.args):
+            yield node.lineno, _render(node.args[0])
+
+
+def explain(conn, sql):
+    params = (None,) * sql.count("?")
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def audit(conn, paths):
+    """Prints each statement's plan and returns the number of problems found."""
+    problems = 0
+    for path in paths:
+        for line, sql in sorted(find_statements(path), key=lambda statement: statement[0]):
+            location = f"{path}:{line}"
+            if sql is None:
+                print(f"FAIL {location}: SQL is built dynamically and can't be audited")
+                problems += 1
+                continue
+
+            try:
+                plan = explain(conn, sql)
+            except sqlite3.Error as e:
+                print(f"FAIL {location}: {e}")
+                problems += 1
+                continue
+
+            derived = {match.group(1) for match in map(DERIVED_RE.match, plan) if match}
+            scans = [
+                match.group(1) for match in map(SCAN_RE.match, plan)
+                if match and match.group(1) not in derived and not match.group(1).startswith("(subquery")
+            ]
+            failed = bool(scans) and bool(WHERE_RE.search(sql))
+            problems += failed
+            print(f"{'FAIL' if failed else 'ok  '} {location}")
+            for step in plan:
+                print(f"       {step}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if any SQL statement in the given modules does a full scan.")
+    parser.add_argument("--db", default="food_assistance.db", help="SQLite database whose schema is audited")
+    parser.add_argument("modules", nargs="*", default=["routes.py"])
+    args = parser.parse_args()
+
+    # Work on a copy so migrations never touch the real file
+    conn = sqlite3.connect(":memory:")
+    source = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    source.backup(conn)
+    source.close()
+    migrate(conn)
+    conn.execute("ANALYZE")
+
+    problems = audit(conn, args.modules)
+    print(f"{problems} statement(s) with full table scans" if problems else "No full table scans")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
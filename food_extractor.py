@@ -0,0 +1,262 @@
+"""
+Rule-based extraction of donated food items and a ZIP code from a chat message.
+
+Handles the common "I have 5 cans of soup and a bag of rice, 20001" messages
+locally; donate_chat only asks Gemini when too much of a message is unrecognized.
+"""
+import re
+from dataclasses import dataclass, field
+
+# Five digits not part of a longer number, price, decimal or fraction; ZIP+4 suffixes are dropped
+ZIP_RE = re.compile(r"(?<![\d$/-])(?<!\d[.,])(\d{5})(?:-\d{4})?(?!\d|[.,]\d|[/%-])")
+# Words, numbers and the punctuation that ends an item ("soup, pasta")
+TOKEN_RE = re.compile(r"\d+(?:[./]\d+)?|[a-z]+(?:'[a-z]+)?|[,;:.!?&+()]")
+
+# Above this share of unrecognized words the message is left to Gemini
+MAX_UNKNOWN_RATIO = 0.2
+
+# Words between a quantity/unit and the food that are kept as part of its name ("5 cans of *black* beans")
+MAX_MODIFIERS = 2
+
+FOOD_WORDS = """
+apple applesauce apricot avocado bagel banana barley bean beef berry blueberry bread broccoli broth butter
+cabbage cake candy cantaloupe carrot cashew cauliflower celery cereal cheese cherry chicken chickpea chili chip
+chocolate coffee cookie corn cornmeal couscous cracker cranberry cream cucumber dairy egg fish flour formula fruit
+garlic granola grape grapefruit grit ham honey hummus jam jelly juice kale ketchup lemon lentil lettuce lime
+macaroni mango margarine mayonnaise meat melon milk mushroom mustard noodle nut oat oatmeal oil onion orange
+pasta peach peanut pear pea pepper pickle pie pineapple pizza plum pork potato poultry pretzel produce
+pudding pumpkin quinoa raisin ramen ravioli rice salad salmon salsa salt sandwich sardine sauce sausage snack
+soda soup spaghetti spice spinach squash stew strawberry stuffing sugar tea tofu tomato tortilla tuna turkey
+vegetable veggie vinegar water watermelon yam yogurt zucchini
+""".split()
+
+# Multi-word entries, one per line, so the single-word list above can stay a plain word list
+FOOD_PHRASES = """
+baby food
+baby formula
+baked beans
+beef jerky
+black beans
+breakfast bar
+brown rice
+canned chicken
+canned fish
+canned food
+canned fruit
+canned goods
+canned meat
+canned tuna
+canned vegetable
+chicken broth
+coconut milk
+cottage cheese
+dried fruit
+energy bar
+evaporated milk
+fresh produce
+frozen meal
+frozen vegetable
+fruit cup
+granola bar
+green beans
+ground beef
+hot sauce
+infant formula
+kidney beans
+macaroni and cheese
+mixed nuts
+olive oil
+orange juice
+pancake mix
+pasta sauce
+peanut butter
+pinto beans
+powdered milk
+protein bar
+rice milk
+soy milk
+spaghetti sauce
+sweet potato
+tomato sauce
+tomato soup
+trail mix
+vegetable oil
+whole wheat bread
+""".strip().splitlines()
+
+UNITS = {
+    "can", "tin", "box", "bag", "bottle", "jar", "carton", "case", "pack", "package", "packet", "loaf",
+    "bunch", "dozen", "lb", "lbs", "pound", "oz", "ounce", "kg", "kilo", "g", "gram", "gallon", "quart",
+    "pint", "liter", "litre", "cup", "tray", "crate", "sack", "container", "pallet", "bowl", "serving",
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "hundred": 100, "dozen": 12, "half": 0.5, "couple": 2, "few": 3, "several": 3,
+}
+
+# Words that carry no item information; they neither count as unknown nor become modifiers
+FILLER = set("""
+i i'd i'm i've im id ive we we'd we're we've my our me us you your it it's its this that these those there here
+have has had got get give giving gave want wanted would like love to donate donating donation donations
+drop dropping off bring bringing can could will just also some any lots lot of plenty extra spare leftover
+and or plus with the a an for in at on from near by around about zip zipcode code postal area is am are
+be been located live living hi hello hey thanks thank please yes no ok okay sure what where how do does
+which who food items item stuff things thing more much many other
+""".split())
+
+
+def singular(word):
+    """Crude plural folding, applied to the lexicon and messages alike."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("ves"):
+        return word[:-3] + "f"
+    if len(word) > 4 and word.endswith(("oes", "xes", "ches", "shes", "sses")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+class FoodTrie:
+    """Word-level trie over the food lexicon; match() finds the longest entry starting at a position."""
+
+    def __init__(self, phrases):
+        self.root = {}
+        for phrase in phrases:
+            node = self.root
+            for word in phrase.split():
+                node = node.setdefault(singular(word), {})
+            node[None] = phrase  # end-of-entry marker
+
+    def match(self, words, start):
+        """Returns (end, entry) of the longest lexicon entry at words[start:], or None."""
+        node, best = self.root, None
+        for position in range(start, len(words)):
+            node = node.get(words[position])
+            if node is None:
+                break
+            if None in node:
+                best = (position + 1, node[None])
+        return best
+
+
+_trie = FoodTrie(FOOD_WORDS + FOOD_PHRASES)
+
+
+@dataclass
+class FoodItem:
+    name: str
+    quantity: float = None
+    unit: str = None
+
+    def __str__(self):
+        if self.quantity is None:
+            return self.name
+        quantity = int(self.quantity) if float(self.quantity).is_integer() else self.quantity
+        return f"{quantity} {self.unit} of {self.name}" if self.unit else f"{quantity} {self.name}"
+
+
+@dataclass
+class Extraction:
+    food_items: list = field(default_factory=list)  # FoodItem
+    zip_code: str = None
+    unknown_words: int = 0
+    total_words: int = 0
+
+    @property
+    def confident(self):
+        """True when few enough words went unrecognized that Gemini is unlikely to find more."""
+        return self.unknown_words <= MAX_UNKNOWN_RATIO * self.total_words
+
+
+def parse_number(token):
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    if "/" in token:
+        numerator, denominator = token.split("/")
+        return int(numerator) / int(denominator) if int(denominator) else None
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def _quantity_before(words, start, floor):
+    """
+    Reads "<number> [unit] [of] [modifiers]" backwards from words[start], stopping at `floor`.
+
+    Returns (first_index, quantity, unit_index, name_index); modifiers are only
+    kept in the name when a quantity or unit anchors them, so "I have fresh
+    apples" stays "apples".
+    """
+    position = start
+    while (position - 1 >= floor and start - position < MAX_MODIFIERS and words[position - 1].isalpha()
+           and words[position - 1] not in FILLER and words[position - 1] not in UNITS
+           and words[position - 1] not in NUMBER_WORDS):
+        position -= 1
+    name_index = position
+
+    if position - 1 >= floor and words[position - 1] == "of":
+        position -= 1
+    unit_index = None
+    if position - 1 >= floor and words[position - 1] in UNITS:
+        position -= 1
+        unit_index = position
+    quantity = parse_number(words[position - 1]) if position - 1 >= floor else None
+    if quantity is not None:
+        position -= 1
+        # "half a case"
+        if words[position] in ("a", "an") and position - 1 >= floor and words[position - 1] == "half":
+            position -= 1
+            quantity = 0.5
+
+    if quantity is None and unit_index is None:
+        return start, None, None, start
+    return position, quantity, unit_index, name_index
+
+
+def extract_donation(message):
+    """Finds food items (with quantities and units) and a ZIP code in a donation message."""
+    text = message.lower()
+    zip_match = ZIP_RE.search(text)
+    zip_code = zip_match.group(1) if zip_match else None
+    if zip_match:
+        text = text[:zip_match.start()] + " , " + text[zip_match.end():]
+
+    raw = TOKEN_RE.findall(text)
+    words = [singular(word) for word in raw]
+    used = [False] * len(words)
+    items = []
+
+    position = floor = 0
+    while position < len(words):
+        found = _trie.match(words, position)
+        if found is None:
+            position += 1
+            continue
+        end = found[0]
+        # Foods written back to back name one item: "chicken noodle soup"
+        while end < len(words) and (next_found := _trie.match(words, end)) is not None:
+            end = next_found[0]
+
+        first, quantity, unit_index, name_start = _quantity_before(words, position, floor)
+        unit = raw[unit_index] if unit_index is not None else None
+        if unit == "dozen":
+            quantity, unit = (quantity or 1) * 12, None
+        items.append(FoodItem(" ".join(raw[name_start:end]), quantity, unit))
+        for i in range(first, end):
+            used[i] = True
+        position = floor = end
+
+    unknown = sum(
+        1 for i, word in enumerate(words)
+        if not used[i] and word.isalpha() and word not in FILLER and raw[i] not in FILLER and word not in UNITS
+        and word not in NUMBER_WORDS
+    )
+
+    # The same food mentioned twice ("soup ... more soup") is reported once
+    unique = list({str(item).lower(): item for item in items}.values())
+    return Extraction(unique, zip_code, unknown, sum(1 for word in words if word.isalpha()))
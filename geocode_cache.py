@@ -0,0 +1,102 @@
+import logging
+import sqlite3
+import threading
+import time
+
+import config
+from cache import MISSING, TTLCache
+
+GEOCODE_CACHE_DB = getattr(config, "GEOCODE_CACHE_DB", "geocode_cache.db")
+GEOCODE_CACHE_SIZE = getattr(config, "GEOCODE_CACHE_SIZE", 2048)
+GEOCODE_CACHE_TTL = getattr(config, "GEOCODE_CACHE_TTL", 30 * 24 * 3600)  # locations rarely move
+GEOCODE_NEGATIVE_TTL = getattr(config, "GEOCODE_NEGATIVE_TTL", 24 * 3600)  # failed lookups are retried daily
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive cache key for an address or ZIP code."""
+    return " ".join(str(query).lower().replace(",", " ").split())
+
+
+class GeocodeCache:
+    """
+    Two-tier geocode cache: an in-process LRU in front of a table in a local SQLite file.
+
+    Coordinates are stored as (lat, lon); a stored None records a lookup the
+    geocoder could not resolve, so repeated bad input doesn't reach the network.
+    """
+
+    def __init__(self, path=GEOCODE_CACHE_DB, maxsize=GEOCODE_CACHE_SIZE,
+                 ttl=GEOCODE_CACHE_TTL, negative_ttl=GEOCODE_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store_hits = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Caller holds self._lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS geocode_cache (
+                    query TEXT PRIMARY KEY,
+                    latitude REAL,
+                    longitude REAL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def get(self, provider, query):
+        """Returns cached (lat, lon), None for a cached failure, or MISSING."""
+        key = f"{provider}:{normalize_query(query)}"
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return value
+
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT latitude, longitude, expires_at FROM geocode_cache WHERE query = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Geocode cache read error: {e}")
+            return MISSING
+
+        # Wall-clock expiry, since entries outlive the process
+        if row is None or row[2] <= time.time():
+            return MISSING
+
+        self.store_hits += 1
+        value = None if row[0] is None else (row[0], row[1])
+        self.memory.set(key, value, ttl=row[2] - time.time())
+        return value
+
+    def set(self, provider, query, coords):
+        key = f"{provider}:{normalize_query(query)}"
+        ttl = self.ttl if coords is not None else self.negative_ttl
+        self.memory.set(key, coords, ttl=ttl)
+
+        lat, lon = coords if coords is not None else (None, None)
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode_cache (query, latitude, longitude, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, lat, lon, time.time() + ttl)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Geocode cache write error: {e}")
+
+    def stats(self):
+        memory = self.memory.stats()
+        return {
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "store_hits": self.store_hits,
+            "misses": memory["misses"] - self.store_hits,
+        }
@@ -0,0 +1,263 @@
+"""
+Schema migrations for the agency database.
+
+Each step runs once; the number of applied steps is stored in SQLite's
+`PRAGMA user_version`. Steps are also written to be safe on databases that
+data_ingestion.py created with the current models.
+
+Usage: python migrations.py
+"""
+import logging
+
+# Characters trimmed from day names, matching str.strip() for the whitespace found in the spreadsheets
+DAY_TRIM = "char(32, 9, 10, 13)"
+
+
+def normalize_day(day):
+    """Lookup key for a day of week (" Monday" -> "monday"), stored in the day_key columns."""
+    return day.strip(" \t\n\r").lower() if isinstance(day, str) else None
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def add_column(conn, table, column, column_type):
+    if column not in columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def add_update_columns(conn):
+    add_column(conn, "agencies", "updates", "TEXT")
+    add_column(conn, "agencies", "last_update_time", "DATETIME")
+
+
+def create_snapshot_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_snapshots (
+            id INTEGER NOT NULL PRIMARY KEY,
+            agency_id VARCHAR NOT NULL,
+            day_of_week VARCHAR,
+            day_key VARCHAR,
+            name VARCHAR NOT NULL,
+            type VARCHAR NOT NULL,
+            address VARCHAR,
+            phone VARCHAR,
+            latitude FLOAT,
+            longitude FLOAT,
+            start_time TIME,
+            end_time TIME,
+            frequency VARCHAR,
+            distribution_model VARCHAR,
+            food_format VARCHAR,
+            appointment_only BOOLEAN,
+            pantry_requirements VARCHAR,
+            wraparound_services TEXT,
+            cultures_served TEXT
+        )
+    """)
+
+
+def add_day_keys(conn):
+    # Searches compare day_key = ? instead of lower(day_of_week) = ?, which no index can serve
+    for table in ("hours_of_operation", "agency_snapshots"):
+        add_column(conn, table, "day_key", "VARCHAR")
+        conn.execute(f"UPDATE {table} SET day_key = lower(trim(day_of_week, {DAY_TRIM})) WHERE day_key IS NULL")
+
+
+def create_indexes(conn):
+    for statement in (
+        # Agency lookups and updates by agency_id; last_update_time lets the join evaluate the expiry cutoff
+        "CREATE INDEX IF NOT EXISTS ix_agencies_agency_id ON agencies (agency_id, last_update_time)",
+        # Expiry purge
+        "CREATE INDEX IF NOT EXISTS ix_agencies_last_update_time ON agencies (last_update_time)",
+        "CREATE INDEX IF NOT EXISTS ix_hours_of_operation_agency_day ON hours_of_operation (agency_id, day_key)",
+        "CREATE INDEX IF NOT EXISTS ix_wraparound_services_agency_id ON wraparound_services (agency_id, service)",
+        "CREATE INDEX IF NOT EXISTS ix_cultures_served_agency_id ON cultures_served (agency_id, cultures)",
+        "CREATE INDEX IF NOT EXISTS ix_agency_snapshots_agency_day ON agency_snapshots (agency_id, day_key)",
+    ):
+        conn.execute(statement)
+
+
+def create_agency_updates_table(conn):
+    # AUTOINCREMENT: ids are event IDs for the update feed, so one must never come back after the purge empties the table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS agency_updates (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            agency_id VARCHAR NOT NULL,
+            message TEXT NOT NULL,
+            created_at DATETIME NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_agency_updates_agency_created ON agency_updates (agency_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_agency_updates_created_at ON agency_updates (created_at)")
+    # Newest update first per agency; readers filter on recency <= N
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS latest_agency_updates AS
+        SELECT id, agency_id, message, created_at,
+               ROW_NUMBER() OVER (PARTITION BY agency_id ORDER BY created_at DESC, id DESC) AS recency
+        FROM agency_updates
+    """)
+
+
+def create_agency_updates(conn):
+    """Moves donation updates from the "; "-joined agencies.updates column into an append-only table."""
+    create_agency_updates_table(conn)
+
+    # Existing updates keep the time of the agency's last update
+    rows = conn.execute(
+        "SELECT agency_id, updates, last_update_time FROM agencies WHERE updates IS NOT NULL AND updates != ''"
+    ).fetchall()
+    for agency_id, updates, last_update_time in rows:
+        for message in updates.split("; "):
+            if message.strip() and last_update_time is not None:
+                conn.execute(
+                    "INSERT INTO agency_updates (agency_id, message, created_at) VALUES (?, ?, ?)",
+                    (agency_id, message.strip(), last_update_time)
+                )
+    conn.execute("UPDATE agencies SET updates = NULL, last_update_time = NULL WHERE updates IS NOT NULL")
+
+
+def fill_display_columns(conn):
+    from voice_summary import display_columns
+
+    rows = conn.execute("SELECT id, name, address, start_time, end_time FROM agency_snapshots").fetchall()
+    conn.executemany(
+        "UPDATE agency_snapshots SET display_name = ?, display_address = ?, display_hours = ? WHERE id = ?",
+        [(*display_columns(name, address, start, end).values(), row_id) for row_id, name, address, start, end in rows]
+    )
+
+
+def add_display_columns(conn):
+    """Spoken/display forms of each snapshot's name, address and hours, so voice summaries don't format per call."""
+    for column in ("display_name", "display_address", "display_hours"):
+        add_column(conn, "agency_snapshots", column, "VARCHAR")
+    fill_display_columns(conn)
+
+
+def fill_agency_snapshots(conn):
+    """
+    Builds agency_snapshots from the source tables when it is empty, as on
+    databases created before data_ingestion.py wrote snapshots. Matches
+    refresh_agency_snapshot(): each agency's first row, its hours in id
+    order, and its distinct non-empty services and cultures as sorted JSON lists.
+    """
+    if conn.execute("SELECT 1 FROM agency_snapshots LIMIT 1").fetchone() is not None:
+        return
+    conn.execute(f"""
+        INSERT INTO agency_snapshots (
+            agency_id, day_of_week, day_key, name, type, address, phone, latitude, longitude,
+            start_time, end_time, frequency, distribution_model, food_format, appointment_only,
+            pantry_requirements, wraparound_services, cultures_served
+        )
+        SELECT a.agency_id, h.day_of_week, lower(trim(h.day_of_week, {DAY_TRIM})), a.name, a.type, a.address,
+               a.phone, a.latitude, a.longitude, h.start_time, h.end_time, h.frequency, h.distribution_model,
+               h.food_format, h.appointment_only, h.pantry_requirements,
+               coalesce(s.services, '[]'), coalesce(c.cultures, '[]')
+        FROM agencies a
+        JOIN hours_of_operation h ON h.agency_id = a.agency_id
+        LEFT JOIN (
+            SELECT agency_id, json_group_array(service) AS services
+            FROM (SELECT DISTINCT agency_id, service FROM wraparound_services
+                  WHERE service != '' ORDER BY agency_id, service)
+            GROUP BY agency_id
+        ) s ON s.agency_id = a.agency_id
+        LEFT JOIN (
+            SELECT agency_id, json_group_array(cultures) AS cultures
+            FROM (SELECT DISTINCT agency_id, cultures FROM cultures_served
+                  WHERE cultures != '' ORDER BY agency_id, cultures)
+            GROUP BY agency_id
+        ) c ON c.agency_id = a.agency_id
+        WHERE a.id IN (SELECT min(id) FROM agencies GROUP BY agency_id)
+        ORDER BY a.id, h.id
+    """)
+    fill_display_columns(conn)
+
+
+def autoincrement_agency_updates(conn):
+    """Rebuilds an agency_updates table created without AUTOINCREMENT, keeping its rows and ids."""
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'agency_updates'").fetchone()[0]
+    if "AUTOINCREMENT" in sql.upper():
+        return
+    conn.execute("DROP VIEW IF EXISTS latest_agency_updates")
+    conn.execute("ALTER TABLE agency_updates RENAME TO agency_updates_old")
+    # The indexes kept their names through the rename; free them for the new table
+    conn.execute("DROP INDEX IF EXISTS ix_agency_updates_agency_created")
+    conn.execute("DROP INDEX IF EXISTS ix_agency_updates_created_at")
+    create_agency_updates_table(conn)
+    conn.execute("""
+        INSERT INTO agency_updates (id, agency_id, message, created_at)
+        SELECT id, agency_id, message, created_at FROM agency_updates_old
+    """)
+    conn.execute("DROP TABLE agency_updates_old")
+
+
+def create_chat_sessions(conn):
+    """Donation chat state, shared by every worker."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            session_id VARCHAR NOT NULL PRIMARY KEY,
+            state TEXT NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated_at ON chat_sessions (updated_at)")
+
+
+# Applied in order; append new steps, never reorder or remove old ones
+MIGRATIONS = [
+    add_update_columns,
+    create_snapshot_table,
+    add_day_keys,
+    create_indexes,
+    create_agency_updates,
+    add_display_columns,
+    fill_agency_snapshots,
+    autoincrement_agency_updates,
+    create_chat_sessions,
+]
+
+
+def migrate(conn):
+    """Applies pending migrations to a DB-API connection. Returns how many ran."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = MIGRATIONS[version:]
+    for number, step in enumerate(pending, start=version + 1):
+        step(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+        logging.info(f"Applied migration {number}: {step.__name__}")
+    return len(pending)
+
+
+_migrated = False  # set once the app database is migrated; inherited by forked workers
+
+
+def migrate_database():
+    """
+    Migrates the app database once per process tree; a failure is logged and the app keeps serving.
+
+    serve.py calls it in the gunicorn arbiter, so the workers it forks skip it
+    instead of racing each other on PRAGMA user_version. It opens its own
+    connection because the pool must not exist before the fork.
+    """
+    global _migrated
+    if _migrated:
+        return
+    # Imported here so data_ingestion.py and explain_queries.py can use migrate() without the app's config
+    import sqlitecloud
+    from config import DATABASE_URL
+
+    try:
+        conn = sqlitecloud.connect(DATABASE_URL)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+        _migrated = True
+    except Exception as e:
+        logging.error(f"Database migration failed: {e}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_database()
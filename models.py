@@ -1,10 +1,12 @@
-from sqlalchemy import Column, String, Integer, Float, Time, ForeignKey, Boolean
+from sqlalchemy import Column, String, Integer, Float, Time, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 from database import Base
 
 class Agency(Base):
     __tablename__ = 'agencies'
+    # Index names match migrations.py, which adds them to databases created before they existed
+    __table_args__ = (Index('ix_agencies_agency_id', 'agency_id', 'last_update_time'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     agency_id = Column(String, nullable=False)
     name = Column(String, nullable=False)
@@ -13,6 +15,9 @@ class Agency(Base):
     phone = Column(String)
     latitude = Column(Float)  # Add this
     longitude = Column(Float)  # Add this
+    updates = Column(Text)  # Legacy; donation updates now live in agency_updates
+    last_update_time = Column(DateTime, index=True)
+    row_hash = Column(String)  # Hash of the spreadsheet fields, for incremental re-ingestion
 
     hours_of_operation = relationship("HoursOfOperation", back_populates="agency", cascade="all, delete-orphan")
     wraparound_services = relationship("WraparoundService", back_populates="agency", cascade="all, delete-orphan")
@@ -20,9 +25,11 @@ class Agency(Base):
 
 class HoursOfOperation(Base):
     __tablename__ = 'hours_of_operation'
+    __table_args__ = (Index('ix_hours_of_operation_agency_day', 'agency_id', 'day_key'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     agency_id = Column(String, ForeignKey('agencies.id'))
     day_of_week = Column(String)
+    day_key = Column(String)  # day_of_week trimmed and lowercased, so lookups can use an index
     start_time = Column(Time)
     end_time = Column(Time)
     frequency = Column(String)
@@ -30,21 +37,81 @@ class HoursOfOperation(Base):
     food_format = Column(String)
     appointment_only = Column(Boolean)
     pantry_requirements = Column(String)
+    source = Column(String)  # Spreadsheet the row was ingested from
+    row_hash = Column(String)
 
     agency = relationship("Agency", back_populates="hours_of_operation")
 
 class WraparoundService(Base):
     __tablename__ = 'wraparound_services'
+    __table_args__ = (Index('ix_wraparound_services_agency_id', 'agency_id', 'service'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     agency_id = Column(String, ForeignKey('agencies.id'))
     service = Column(String)
+    source = Column(String)  # Spreadsheet the row was ingested from
+    row_hash = Column(String)
 
     agency = relationship("Agency", back_populates="wraparound_services")
 
 class CultureServed(Base):
     __tablename__ = 'cultures_served'
+    __table_args__ = (Index('ix_cultures_served_agency_id', 'agency_id', 'cultures'),)
     id = Column(Integer, primary_key=True, autoincrement=True)
     agency_id = Column(String, ForeignKey('agencies.id'))
     cultures = Column(String)
+    source = Column(String)  # Spreadsheet the row was ingested from
+    row_hash = Column(String)
 
     agency = relationship("Agency", back_populates="cultures_served")
+
+class AgencyUpdate(Base):
+    """A donation update posted for an agency. Rows are only inserted, then deleted 48 hours later."""
+    __tablename__ = 'agency_updates'
+    # AUTOINCREMENT, as in migrations.py: ids are update feed event IDs and must never be reused
+    __table_args__ = (Index('ix_agency_updates_agency_created', 'agency_id', 'created_at'), {'sqlite_autoincrement': True})
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    agency_id = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+class AgencySnapshot(Base):
+    """Denormalized agency record, one row per hours_of_operation entry, rebuilt by data_ingestion.py (first built by migrations.py)."""
+    __tablename__ = 'agency_snapshots'
+    __table_args__ = (Index('ix_agency_snapshots_agency_day', 'agency_id', 'day_key'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    agency_id = Column(String, nullable=False)
+    day_of_week = Column(String)
+    day_key = Column(String)  # day_of_week trimmed and lowercased, so lookups can use an index
+    name = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    address = Column(String)
+    phone = Column(String)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    start_time = Column(Time)
+    end_time = Column(Time)
+    frequency = Column(String)
+    distribution_model = Column(String)
+    food_format = Column(String)
+    appointment_only = Column(Boolean)
+    pantry_requirements = Column(String)
+    wraparound_services = Column(Text)  # JSON list of services
+    cultures_served = Column(Text)  # JSON list of cultures
+    # Precomputed for voice summaries (see voice_summary.display_columns)
+    display_name = Column(String)
+    display_address = Column(String)
+    display_hours = Column(String)  # "9:00 AM to 11:00 AM"
+
+class ChatSession(Base):
+    """A donation chat's state (conversations.Conversation as JSON), so any worker can serve the next turn."""
+    __tablename__ = 'chat_sessions'
+    session_id = Column(String, primary_key=True)
+    state = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+class IngestionWatermark(Base):
+    """Content hash of each spreadsheet at its last successful sync, so unchanged files are skipped."""
+    __tablename__ = 'ingestion_watermarks'
+    path = Column(String, primary_key=True)
+    file_hash = Column(String, nullable=False)
+    synced_at = Column(DateTime)
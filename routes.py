@@ -1,29 +1,93 @@
-from flask import Blueprint, request, jsonify, render_template, Flask
+from flask import Blueprint, request, jsonify, render_template, Flask, Response
 from database import get_connection
+from spatial_index import get_agency_index, geohash
+from distance import geodesic_miles
+from cache import MISSING, CoalescingCache, TTLCache
+from geocode_cache import GeocodeCache
+from zip_centroids import lookup_zip
+from food_extractor import extract_donation
+from conversations import CHAT_SESSION_PURGE_INTERVAL, ConversationStore
+from scheduler import start_job
+from update_feed import FEED_POLL_INTERVAL, FeedFullError, UpdateFeed, stream_events
+from voice_summary import iter_voice_summary
+from search_engine import SearchQuery, decode_cursor, donation_record, expert_record, get_search_engine, map_marker
 from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
 import logging
 import json
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Union
+import config
 from config import API_KEY, GEMINI_API_KEY
 from datetime import datetime, timedelta
 import google.generativeai as genai
 
 api_blueprint = Blueprint("api", __name__)
-genai.configure(api_key=GEMINI_API_KEY)
+# REST transport goes through patched sockets, so Gemini calls yield under the gevent server
+genai.configure(api_key=GEMINI_API_KEY, transport="rest")
 model = genai.GenerativeModel('gemini-1.5-flash')
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Donation updates expire after 48 hours; the purge job runs every UPDATE_EXPIRY_INTERVAL seconds
+UPDATE_TTL = timedelta(hours=48)
+AGENCY_UPDATES_LIMIT = getattr(config, "AGENCY_UPDATES_LIMIT", 5)  # latest updates shown per agency
+UPDATE_EXPIRY_INTERVAL = getattr(config, "UPDATE_EXPIRY_INTERVAL", 600)
+
+# Recent /search results keyed on (geohash, radius, day, homeDelivery)
+search_cache = TTLCache(
+    maxsize=getattr(config, "SEARCH_CACHE_SIZE", 1024),
+    ttl=getattr(config, "SEARCH_CACHE_TTL", 60)
+)
+SEARCH_CACHE_SYNC_INTERVAL = getattr(config, "SEARCH_CACHE_SYNC_INTERVAL", 5)  # seconds between checks for other workers' updates
+SEARCH_MAX_RADIUS = getattr(config, "SEARCH_MAX_RADIUS", 100)  # miles; the map's radius slider stops here
+
+# Geocoder results, shared by every route that turns an address or ZIP into coordinates
+geocode_cache = GeocodeCache()
+
+# Donation chat transcripts live in the database, so any worker can take the next turn;
+# clients send only their session ID and new message
+conversations = ConversationStore()
+CHAT_MAX_MESSAGE_CHARS = getattr(config, "CHAT_MAX_MESSAGE_CHARS", 2000)
+
+# Sites read out per Vapi call; the rest are only counted
+VOICE_TOP_K = getattr(config, "VOICE_TOP_K", 5)
+
+# Live donation updates pushed to /updates/stream clients
+update_feed = UpdateFeed()
+FEED_MAX_RADIUS = getattr(config, "FEED_MAX_RADIUS", 50)  # miles; larger areas would watch most agencies
+FEED_BACKLOG_LIMIT = getattr(config, "FEED_BACKLOG_LIMIT", 50)  # missed updates replayed on reconnect
+
+# Gemini calls made on behalf of a request run here, so independent calls overlap
+GEMINI_TIMEOUT = getattr(config, "GEMINI_TIMEOUT", 8)  # seconds a request waits for its Gemini calls
+# Also the limit on each call itself, so a hung call gives its pool thread back
+GEMINI_REQUEST_OPTIONS = {"timeout": GEMINI_TIMEOUT}
+gemini_pool = ThreadPoolExecutor(max_workers=getattr(config, "GEMINI_WORKERS", 16), thread_name_prefix="gemini")
+
+# Gemini responses keyed on normalized prompt input; concurrent identical prompts share one call
+gemini_cache = CoalescingCache(
+    maxsize=getattr(config, "GEMINI_CACHE_SIZE", 2048),
+    ttl=getattr(config, "GEMINI_CACHE_TTL", 3600)
+)
+
 # ----------------------------
 # Utility Functions
 # ----------------------------
 
 def get_lat_lon(address):
+    # Plain ZIP codes resolve from the bundled centroid table without a network call
+    centroid = lookup_zip(address)
+    if centroid:
+        return centroid
+
+    cached = geocode_cache.get("google", address)
+    if cached is not MISSING:
+        return cached if cached else (None, None)
+
     api_key = API_KEY
     
     url = f"https://maps.googleapis.com/maps/api/geocode/json?address={address}&key={api_key}"
@@ -33,11 +97,22 @@ def get_lat_lon(address):
     
     if data["status"] == "OK":
         location = data["results"][0]["geometry"]["location"]
+        geocode_cache.set("google", address, (location["lat"], location["lng"]))
         return location["lat"], location["lng"]
+    if data["status"] == "ZERO_RESULTS":
+        # Only definitive misses are cached; quota and auth errors are retried
+        geocode_cache.set("google", address, None)
     return None, None
 
 def get_lat_lon_by_address(address):
     if address:
+        centroid = lookup_zip(address)
+        if centroid:
+            return centroid
+
+        cached = geocode_cache.get("zippopotam", address)
+        if cached is not MISSING:
+            return cached if cached else (jsonify({"error": "Location not found"}), 404)
         try:
             resp = requests.get(f"https://api.zippopotam.us/us/{address}", timeout=5)
             if resp.status_code == 200:
@@ -46,8 +121,11 @@ def get_lat_lon_by_address(address):
                 lati = float(place["latitude"])
                 lngi = float(place["longitude"])
                 user_coords = (lati, lngi)
+                geocode_cache.set("zippopotam", address, user_coords)
                 return user_coords
             else:
+                if resp.status_code == 404:
+                    geocode_cache.set("zippopotam", address, None)
                 return jsonify({"error": "Location not found"}), 404
         except requests.RequestException:
             return jsonify({"error": "Geocoding service unavailable"}), 503
@@ -55,156 +133,80 @@ def get_lat_lon_by_address(address):
         return jsonify({"error": "Address or coordinates are required"}), 400
 
 def calculate_distance(lat1, lon1, lat2, lon2):
-    return round(geodesic((lat1, lon1), (lat2, lon2)).miles, 2)
+    return round(geodesic_miles(lat1, lon1, lat2, lon2), 2)
+
+def sql_placeholders(values):
+    return ", ".join("?" for _ in values)
 
 from datetime import datetime
 import logging
 
-def format_time_12hr(time_str):
-    if not time_str:
-        return None
-    try:
-        # Try with microseconds
-        time_obj = datetime.strptime(time_str, "%H:%M:%S.%f").time()
-    except ValueError:
-        try:
-            # Fallback to without microseconds
-            time_obj = datetime.strptime(time_str, "%H:%M:%S").time()
-        except Exception as e:
-            logging.error(f"Time formatting error: {e}")
-            return None
-
-    return time_obj.strftime("%I:%M %p").lstrip("0")
-
-
-def generate_voice_summary(agencies, day_of_week):
-    if not agencies:
-        return f"I couldn't find any food sites open on {day_of_week}. Would you like to try a different day?"
-
-    summary = f"I found {len(agencies)} food site{'s' if len(agencies) > 1 else ''} near you for {day_of_week}. "
-
-    for agency in agencies:
-        name = agency['name'].split(':')[1].strip() if ':' in agency['name'] else agency['name']
-        address = agency['address'].replace("Attn:", "").strip()
-        start_time = format_time_12hr(agency['start_time']) if agency['start_time'] else None
-        end_time = format_time_12hr(agency['end_time']) if agency['end_time'] else None
-        appointment = "Appointments are required" if agency.get('appointment_only') else "Walk-ins are welcome"
-        cultures = f"Serves: {', '.join(agency['cultures_served'])}" if agency.get('cultures_served') else None
-        distance = f"about {agency['distance']} miles away" if agency.get('distance') else None
-        model = agency.get('distribution_model')
-        food_format = agency.get('food_format')
-        frequency = agency.get('frequency')
-        requirements = agency.get('pantry_requirements')
-        phone = agency.get('phone')
-        wraparound = agency.get('wraparound_services')
-
-        # Time phrase
-        if start_time and end_time:
-            time_phrase = f"open from {start_time} to {end_time}"
-
-        else:
-            time_phrase = "operating hours are currently not available"
-            
-        print(agency['name'], agency['start_time'], agency['end_time'])
-
-        # Conversational extras summary
-        extras_sentences = []
-
-        if distance:
-            extras_sentences.append(f"It's about {agency['distance']} miles away.")
-        if model:
-            extras_sentences.append(f"It's a {model.lower()} site.")
-        if food_format:
-            extras_sentences.append(f"They offer {food_format.lower()}.")
-        if frequency:
-            extras_sentences.append(f"This site operates {frequency.lower()}.")
-        if requirements:
-            extras_sentences.append("You may need an ID or meet other requirements.")
-        if cultures:
-            extras_sentences.append(f"This site serves communities including {', '.join(agency['cultures_served'])}.")
-        if wraparound:
-            extras_sentences.append("Wraparound services are also available.")
-        if phone:
-            extras_sentences.append(f"If you have questions, you can call them at {phone}.")
-
-        extras_phrase = " ".join(extras_sentences)
-
-        summary += f"{name}, located at {address}, is {time_phrase}. {appointment}. {extras_phrase}. "
-
-    summary += "Would you like directions or to hear more options?"
-    return summary
-
-
-def fetch_filtered_agencies(address, day_of_week, max_distance=5.0):
+def normalize_prompt(text):
+    """Cache key form of user text: case, spacing and trailing punctuation don't change Gemini's answer."""
+    return " ".join(str(text).lower().split()).rstrip(".!?")
+
+def parse_json_reply(response_text):
+    """Parses a JSON reply from Gemini, removing any markdown code blocks around it."""
+    if '```json' in response_text:
+        response_text = response_text.split('```json')[1].split('```')[0].strip()
+    elif '```' in response_text:
+        response_text = response_text.split('```')[1].split('```')[0].strip()
+    return json.loads(response_text)
+
+def cached_generate(kind, key_text, prompt, parse=None):
+    """
+    Text of model.generate_content(prompt), or parse(text), cached under (kind, normalized key_text).
+
+    A reply that `parse` rejects raises and is not cached.
+    """
+    def generate():
+        text = model.generate_content(prompt, request_options=GEMINI_REQUEST_OPTIONS).text.strip()
+        return parse(text) if parse else text
+
+    return gemini_cache.get_or_compute((kind, normalize_prompt(key_text)), generate)
+
+def cached_chat_reply(messages, prompt):
+    """Text of a chat reply to `prompt` after `messages`, cached on the normalized conversation."""
+    conversation = tuple((m["role"], normalize_prompt(" ".join(m["parts"]))) for m in messages)
+    return gemini_cache.get_or_compute(
+        ("chat", conversation, prompt),
+        lambda: model.start_chat(history=messages).send_message(prompt, request_options=GEMINI_REQUEST_OPTIONS).text.strip()
+    )
+
+def page_args(args):
+    """(limit, after) from the `limit` and `cursor` query parameters; raises ValueError on bad values."""
+    limit = args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("limit must be a positive integer")
+        limit = int(limit)
+    cursor = args.get("cursor")
+    return limit, decode_cursor(cursor) if cursor else None
+
+def facet_args(args):
+    """/search's optional facet filters as SearchQuery keyword arguments; cultures and services are comma separated."""
+    def names(param):
+        return tuple(sorted({name.strip() for value in args.getlist(param) for name in value.split(",") if name.strip()}))
+
+    return {
+        "prepared_meals": args.get("preparedMeals") == "true",
+        "walk_in": args.get("walkIn") == "true",
+        "cultures": names("cultures"),
+        "services": names("services"),
+    }
+
+def fetch_filtered_agencies(address, day_of_week, max_distance=5.0, limit=None, after=None):
+    """Returns (SearchPage, 200) for the agencies open on `day_of_week`, or (error dict, status)."""
     try:
         user_lat, user_lon = get_lat_lon(address)
         if not user_lat or not user_lon:
             return {"error": "Invalid location"}, 400
 
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT a.agency_id, a.name, a.type, a.address, a.phone, a.latitude, a.longitude,
-                   h.day_of_week, h.start_time, h.end_time, h.frequency,
-                   h.distribution_model, h.food_format, h.appointment_only, h.pantry_requirements,
-                   w.service, c.cultures, a.updates
-            FROM agencies a
-            JOIN hours_of_operation h ON a.agency_id = h.agency_id
-            LEFT JOIN wraparound_services w ON a.agency_id = w.agency_id
-            LEFT JOIN cultures_served c ON a.agency_id = c.agency_id
-            WHERE lower(h.day_of_week) = ?
-        """, (day_of_week.lower(),))
-
-        agency_map = {}
-        for row in cursor.fetchall():
-            (
-                aid, name, typ, address, phone, lat, lon,
-                dow, start, end, freq, model, fmt, appt, pantry,
-                service, culture, updates
-            ) = row
-
-            distance = calculate_distance(user_lat, user_lon, lat, lon)
-            if distance > max_distance:
-                continue
-
-            if aid not in agency_map:
-                agency_map[aid] = {
-                    "id": aid,
-                    "name": name,
-                    "type": typ,
-                    "address": address,
-                    "phone": phone,
-                    "latitude": lat,
-                    "longitude": lon,
-                    "distance": round(distance, 2),
-                    "day_of_week": dow,
-                    "start_time": start,
-                    "end_time": end,
-                    "frequency": freq,
-                    "distribution_model": model,
-                    "food_format": fmt,
-                    "appointment_only": bool(appt),
-                    "pantry_requirements": pantry,
-                    "updates": updates,
-                    "wraparound_services": set(),
-                    "cultures_served": set()
-                }
-
-            if service:
-                agency_map[aid]["wraparound_services"].add(service)
-            if culture:
-                agency_map[aid]["cultures_served"].add(culture)
-
-        result = []
-        for agency in agency_map.values():
-            agency["wraparound_services"] = list(agency["wraparound_services"])
-            agency["cultures_served"] = list(agency["cultures_served"])
-            result.append(agency)
-
-        result.sort(key=lambda x: x["distance"])
-        conn.close()
-        return result, 200
+        page = run_search(
+            SearchQuery(user_lat, user_lon, max_distance, day_of_week, limit=limit, after=after),
+            expert_record
+        )
+        return page, 200
 
     except Exception as e:
         logging.error(f"Expert Query Error: {e}")
@@ -226,6 +228,16 @@ def app_page():
 def donate_page():
     return render_template("donate.html")
 
+@api_blueprint.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "geocode": geocode_cache.stats(),
+        "search": search_cache.stats(),
+        "gemini": gemini_cache.stats(),
+        "conversations": conversations.stats(),
+        "update_feed": update_feed.stats()
+    })
+
 @api_blueprint.route("/agencies", methods=["GET"])
 def get_agencies():
     try:
@@ -260,117 +272,48 @@ def get_agency(agency_id):
 @api_blueprint.route("/search", methods=["GET"])
 def search_agencies():
     address = request.args.get("address")  # Get address or ZIP code
-    radius = float(request.args.get("radius", 5))  # Default radius = 5 miles
+    radius = min(float(request.args.get("radius", 5)), SEARCH_MAX_RADIUS)  # Default radius = 5 miles
     lat = request.args.get("lat")  # If user selects to filter from their current location
     lng = request.args.get("lng") # If user selects to filter from their current location
     day = request.args.get("day")  # Day of the week for filtering
     home_delivery = request.args.get("homeDelivery") == "true"  # Home delivery option
+    facets = facet_args(request.args)  # Prepared meals, walk-in, cultures served, wraparound services
     
-    # Clear old updates automatically when searching
-    clear_old_updates()
-   
     if address:
        user_coords = get_lat_lon_by_address(address)
+       if not isinstance(user_coords[0], float):
+           return user_coords  # geocoder error response
     
     elif lat and lng: # If user gave the site their current location
         user_coords = (float(lat), float(lng))  
     else:
         return jsonify({"error": "Address or coordinates are required"}), 400
+
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
    
-    conn = get_connection()
-    cursor = conn.cursor()
+    # Searches from the same ~150 m neighborhood with the same filters share a result
+    cache_key = (
+        geohash(user_coords[0], user_coords[1]), radius, (day or "").lower(), home_delivery, limit, after,
+        tuple(facets.values())
+    )
+    page = search_cache.get(cache_key)
+    if page is MISSING:
+        page = run_search(
+            SearchQuery(user_coords[0], user_coords[1], radius, day, home_delivery, limit, after, **facets),
+            map_marker
+        )
+        search_cache.set(cache_key, page)
+    return paged_response(page)
 
-    # This query retrieves all necessary agency data with joins
-    agencies = cursor.execute("""SELECT a.agency_id, a.name, a.type, a.address, a.phone, a.latitude, a.longitude,
-                   h.day_of_week, h.start_time, h.end_time ,h.distribution_model, h.food_format, h.appointment_only, h.pantry_requirements,
-                   w.service, c.cultures, a.updates
-            FROM agencies a
-            JOIN hours_of_operation h ON a.agency_id = h.agency_id
-            LEFT JOIN wraparound_services w ON a.agency_id = w.agency_id
-            LEFT JOIN cultures_served c ON a.agency_id = c.agency_id""")
-    conn.close()
-    
-    nearby_agencies = []
-    agency_map = {}
-    
-    for agency in agencies:
-        agency_id, name, type, address, phone, latitude, longitude, day_of_week, start_time, end_time, distribution, food_format, appointment, pantry_req, wrap_service, culture, updates = agency  # unpack tuple
-        agency_coords = (latitude, longitude)
-        distance = geodesic(user_coords, agency_coords).miles  # Calculate distance
-        
-        if day_of_week is None:
-            day_of_week = "Null"
-
-        if distance <= radius and (day_of_week.lower() == day.lower() or day_of_week.lower() == "As Needed"):  # Check if the agency is within the radius and matches the day of the week
-            
-            # Only process each agency once using agency_map for deduplication
-            if agency_id not in agency_map:
-                # Prepared meals availability
-                if food_format is None:
-                    food_format = "N/A"
-                if "Prepared meals" in food_format:
-                    food_format = "Available✅"
-                else:
-                    food_format = "Not available❌"
-            
-                # Appointment requirements
-                if appointment is None:
-                    appointment = "N/A"
-                if appointment == 1:
-                    appointment = "Required⚠️"
-                else:
-                    appointment = "Not required✅"    
-                
-                # Home delivery availability
-                if distribution is None:
-                    distribution = "N/A"
-                if "Home Delivery" in distribution:
-                    hd_status = "Available✅"
-                else:
-                    hd_status = "Not available❌"   
-                    
-                # Start and end times
-                if start_time is None:
-                    start_time = "N/A"     
-                if end_time is None:
-                    end_time = "N/A"
-                open_hours = start_time[:5] + " - " + end_time[:5]
-                
-                # Dealing with address inconsistencies ('Attn:' prefix in some addresses)
-                if address and address[:5] == "Attn:":
-                    address = address[5:]
-                
-                # Check if agency should be included based on home delivery preference
-                should_include = False
-                if "Home Delivery" in distribution and home_delivery:
-                    should_include = True
-                elif not home_delivery:
-                    should_include = True
-                
-                if should_include:
-                    agency_map[agency_id] = {
-                        "id": agency_id,
-                        "name": name.split(':')[1].strip() if ':' in name else name,
-                        "latitude": latitude,
-                        "longitude": longitude,
-                        "distance": round(distance, 2),
-                        "phone": phone if phone else "No phone number available",
-                        "day": day_of_week,
-                        "Prepared_meals": food_format,
-                        "appointment": appointment,
-                        "home_delivery": hd_status,
-                        "address": address,
-                        "hours": open_hours,
-                        "updates": updates,
-                    }
-    
-    # Convert agency_map to list
-    nearby_agencies = list(agency_map.values())
-    
-    # Sort by distance
-    nearby_agencies.sort(key=lambda x: x["distance"])
-    
-    return jsonify(nearby_agencies)
+def paged_response(page):
+    """A list endpoint's JSON; X-Next-Cursor carries the cursor for the next page, if there is one."""
+    response = jsonify(page.agencies)
+    if page.next_cursor:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return response
 
 # ----------------------------
 # Expert Query Route (Browser)
@@ -380,14 +323,18 @@ def search_agencies():
 def get_filtered_agencies():
     address = request.args.get("address")
     day_of_week = request.args.get("day_of_week")
-    max_distance = float(request.args.get("max_distance", 5.0))
+    max_distance = min(float(request.args.get("max_distance", 5.0)), SEARCH_MAX_RADIUS)
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    agencies, status_code = fetch_filtered_agencies(address, day_of_week, max_distance)
+    page, status_code = fetch_filtered_agencies(address, day_of_week, max_distance, limit, after)
     
     if status_code != 200:
-        return jsonify(agencies), status_code
+        return jsonify(page), status_code
         
-    return jsonify(agencies), 200
+    return paged_response(page), 200
 
 
 # ----------------------------
@@ -424,17 +371,25 @@ def vapi_tool_handler():
                 day_of_week = args["day_of_week"]
 
                 # Call the new function directly with the parsed arguments
-                response_data, status_code = fetch_filtered_agencies(address, day_of_week)
+                # Only the sites that will be read out are looked up
+                response_data, status_code = fetch_filtered_agencies(address, day_of_week, limit=VOICE_TOP_K)
 
                 if status_code != 200:
                     return jsonify({"results": [{"toolCallId": tool_call.id, "result": json.dumps(response_data)}]}), status_code
 
-                summary = generate_voice_summary(response_data, day_of_week.title())
+                chunks = iter_voice_summary(
+                    response_data.agencies, day_of_week.title(), VOICE_TOP_K,
+                    more=response_data.next_cursor is not None
+                )
+
+                # Plain-text callers get each sentence group as soon as it is rendered
+                if request.args.get("stream") == "true":
+                    return Response(chunks, mimetype="text/plain")
 
                 return jsonify({
                     "results": [{
                         "toolCallId": tool_call.id,
-                        "result": summary
+                        "result": "".join(chunks)
                     }]
                 }), 200
 
@@ -511,68 +466,101 @@ def on_call_end():
 # ----------------------------
 
 
+def timed(timings, leg, func, *args):
+    """Calls func(*args), recording its duration in seconds as timings[leg]."""
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[leg] = time.perf_counter() - start
+        logging.info(f"Gemini {leg} call took {timings[leg] * 1000:.0f} ms")
+
+def gemini_result(future, leg, default, deadline):
+    """Waits until `deadline` (time.monotonic()) for a pooled Gemini call; `default` if it fails or times out."""
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        # The call finishes in the background and still fills the cache for the next request
+        logging.warning(f"Gemini {leg} call timed out after {GEMINI_TIMEOUT}s")
+    except Exception as e:
+        logging.error(f"Gemini {leg} error: {e}")
+    return default
+
+def server_timing(timings):
+    """Server-Timing header value for the Gemini calls a request made, in milliseconds."""
+    # A timed-out call's pool thread can still write its leg; iterate over a copy
+    return ", ".join(f"{leg};dur={seconds * 1000:.1f}" for leg, seconds in dict(timings).items())
+
+def gemini_extract(user_message):
+    """Food items and ZIP code Gemini finds in a donation message; ([], None) if the call fails."""
+    extraction_prompt = f"""
+    You are a food donation assistant. Extract the following information from the user message:
+
+    REQUIRED FORMAT: Return ONLY valid JSON with this exact structure:
+    {{
+        "food_items": ["item1", "item2", ...],
+        "zip_code": "12345" or null
+    }}
+
+    INSTRUCTIONS:
+    - Extract all food items mentioned (canned goods, fresh produce, dairy, etc.)
+    - Extract any 5-digit US zip code
+    - If no food items found, use empty array: []
+    - If no zip code found, use null
+    - Return ONLY the JSON, no additional text
+
+    USER MESSAGE: "{user_message}"
+
+    JSON RESPONSE:
+    """
+
+    try:
+        # Extract information using Gemini; only replies that parse are cached
+        extracted_data = cached_generate("extract", user_message, extraction_prompt, parse=parse_json_reply)
+
+        food_items = extracted_data.get("food_items", [])
+        zip_code = extracted_data.get("zip_code")
+
+        # Validate zip code format if present
+        if zip_code and (not isinstance(zip_code, str) or not zip_code.isdigit() or len(zip_code) != 5):
+            zip_code = None
+
+    except json.JSONDecodeError as e:
+        logging.error(f"JSON parsing error: {e}, Response: {e.doc}")
+        food_items = []
+        zip_code = None
+    except Exception as e:
+        logging.error(f"Gemini extraction error: {e}")
+        food_items = []
+        zip_code = None
+    return food_items, zip_code
+
 @api_blueprint.route("/donate/chat", methods=["POST"])
 def donate_chat():
     try:
         data = request.get_json()
         user_message = data.get("message", "").strip()
-        chat_history = data.get("history", [])
         
         if not user_message:
             return jsonify({"error": "Message is required"}), 400
-        
-        # Use Gemini to extract food items and zip code
-        extraction_prompt = f"""
-        You are a food donation assistant. Extract the following information from the user message:
-
-        REQUIRED FORMAT: Return ONLY valid JSON with this exact structure:
-        {{
-            "food_items": ["item1", "item2", ...],
-            "zip_code": "12345" or null
-        }}
-
-        INSTRUCTIONS:
-        - Extract all food items mentioned (canned goods, fresh produce, dairy, etc.)
-        - Extract any 5-digit US zip code
-        - If no food items found, use empty array: []
-        - If no zip code found, use null
-        - Return ONLY the JSON, no additional text
-
-        USER MESSAGE: "{user_message}"
-
-        JSON RESPONSE:
-        """
-        
-        try:
-            # Extract information using Gemini
-            extraction_response = model.generate_content(extraction_prompt)
-            response_text = extraction_response.text.strip()
-            
-            # Clean up the response to extract JSON
-            # Remove any markdown code blocks if present
-            if '```json' in response_text:
-                response_text = response_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in response_text:
-                response_text = response_text.split('```')[1].split('```')[0].strip()
-            
-            # Parse the JSON response
-            extracted_data = json.loads(response_text)
-            
-            food_items = extracted_data.get("food_items", [])
-            zip_code = extracted_data.get("zip_code")
-            
-            # Validate zip code format if present
-            if zip_code and (not isinstance(zip_code, str) or not zip_code.isdigit() or len(zip_code) != 5):
-                zip_code = None
-            
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON parsing error: {e}, Response: {response_text}")
-            food_items = []
-            zip_code = None
-        except Exception as e:
-            logging.error(f"Gemini extraction error: {e}")
-            food_items = []
-            zip_code = None
+        if len(user_message) > CHAT_MAX_MESSAGE_CHARS:
+            return jsonify({"error": f"Messages are limited to {CHAT_MAX_MESSAGE_CHARS} characters"}), 413
+        
+        # Older clients send the whole transcript, ending with this message; it only seeds new sessions
+        history = data.get("history") or []
+        if history and history[-1].get("role") == "user" and history[-1].get("content", "").strip() == user_message:
+            history = history[:-1]
+        session_id, conversation = conversations.get(data.get("session_id"), history)
+        summary, recent = conversation.snapshot()
+        
+        # Common messages are parsed locally in microseconds; Gemini only sees the rest
+        timings = {}
+        # Concurrent calls share one deadline, so a request waits at most GEMINI_TIMEOUT in total
+        deadline = time.monotonic() + GEMINI_TIMEOUT
+        local = extract_donation(user_message)
+        extraction = None
+        if not local.confident:
+            extraction = gemini_pool.submit(timed, timings, "extract", gemini_extract, user_message)
         
         # Generate conversational response
         conversation_context = """
@@ -584,23 +572,29 @@ def donate_chat():
         Keep responses concise and friendly. If the user mentions food items but no zip code, ask for zip code.
         """
         
-        # Build conversation history for context
+        # Bounded context: the summary of earlier turns plus the last few messages
+        if summary:
+            conversation_context += "\n" + summary
         messages = [{"role": "user", "parts": [conversation_context]}]
         
-        for msg in chat_history:
-            role = "user" if msg.get("role") == "user" else "model"
-            messages.append({"role": role, "parts": [msg.get("content", "")]})
+        for role, content in recent:
+            messages.append({"role": role, "parts": [content]})
         
         messages.append({"role": "user", "parts": [user_message]})
         
-        # Get conversational response
-        try:
-            chat = model.start_chat(history=messages)
-            response = chat.send_message("Provide a helpful response about food donation")
-            ai_response = response.text.strip()
-        except Exception as e:
-            logging.error(f"Gemini chat error: {e}")
-            ai_response = "I'd be happy to help you find places to donate food. What would you like to donate?"
+        # The chat reply doesn't depend on the extraction, so both Gemini calls run at once
+        chat = gemini_pool.submit(
+            timed, timings, "chat", cached_chat_reply, messages, "Provide a helpful response about food donation"
+        )
+        
+        if extraction is None:
+            food_items = [str(item) for item in local.food_items]
+            zip_code = local.zip_code
+        else:
+            food_items, zip_code = gemini_result(extraction, "extraction", ([], None), deadline)
+        ai_response = gemini_result(
+            chat, "chat", "I'd be happy to help you find places to donate food. What would you like to donate?", deadline
+        )
         
         # Determine if we need zip code
         needs_zip = False
@@ -613,13 +607,18 @@ def donate_chat():
                     food_list += f" and {len(food_items) - 3} more items"
                 ai_response = f"Great! I see you want to donate {food_list}. To find nearby donation centers, please provide your 5-digit zip code."
         
+        conversation.add("user", user_message)
+        conversation.add("model", ai_response)
+        conversations.save(session_id, conversation)
+        
         return jsonify({
             "response": ai_response,
+            "session_id": session_id,
             "needs_zip": needs_zip,
             "extracted_food_items": food_items,
             "extracted_zip_code": zip_code,
             "status": "success"
-        }), 200
+        }), 200, {"Server-Timing": server_timing(timings)}
         
     except Exception as e:
         logging.error(f"Chat error: {e}")
@@ -637,74 +636,17 @@ def get_agencies_by_zip():
         if not user_lat or not user_lon:
             return jsonify({"error": "Invalid zip code"}), 400
         
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Get all agencies with their details
-        cursor.execute("""
-            SELECT a.agency_id, a.name, a.type, a.address, a.phone, a.latitude, a.longitude,
-                   h.day_of_week, h.start_time, h.end_time, h.distribution_model, h.food_format, 
-                   h.appointment_only, h.pantry_requirements, w.service, c.cultures, a.updates
-            FROM agencies a
-            JOIN hours_of_operation h ON a.agency_id = h.agency_id
-            LEFT JOIN wraparound_services w ON a.agency_id = w.agency_id
-            LEFT JOIN cultures_served c ON a.agency_id = c.agency_id
-        """)
-        
-        agencies = []
-        agency_map = {}
-        
-        for row in cursor.fetchall():
-            (agency_id, name, type, address, phone, lat, lon, day_of_week, 
-             start_time, end_time, distribution, food_format, appointment, 
-             pantry_req, wrap_service, culture, updates) = row
-            
-            # Calculate distance
-            distance = calculate_distance(user_lat, user_lon, lat, lon)
-            
-            # Only include agencies within 5 miles
-            if distance <= 5.0:
-                if agency_id not in agency_map:
-                    agency_map[agency_id] = {
-                        "id": agency_id,
-                        "name": name.split(':')[1].strip() if ':' in name else name,
-                        "type": type,
-                        "address": address.replace("Attn:", "").strip() if address and address.startswith("Attn:") else address,
-                        "phone": phone if phone else "Phone not available",
-                        "latitude": lat,
-                        "longitude": lon,
-                        "distance": round(distance, 2),
-                        "day_of_week": day_of_week,
-                        "start_time": start_time,
-                        "end_time": end_time,
-                        "distribution_model": distribution,
-                        "food_format": food_format,
-                        "appointment_only": bool(appointment) if appointment is not None else False,
-                        "pantry_requirements": pantry_req,
-                        "updates": updates,
-                        "wraparound_services": set(),
-                        "cultures_served": set()
-                    }
-                
-                if wrap_service:
-                    agency_map[agency_id]["wraparound_services"].add(wrap_service)
-                if culture:
-                    agency_map[agency_id]["cultures_served"].add(culture)
-        
-        # Convert sets to lists and add to result
-        for agency in agency_map.values():
-            agency["wraparound_services"] = list(agency["wraparound_services"])
-            agency["cultures_served"] = list(agency["cultures_served"])
-            agencies.append(agency)
-        
-        # Sort by distance
-        agencies.sort(key=lambda x: x["distance"])
+        try:
+            limit, after = page_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        conn.close()
+        page = run_search(SearchQuery(user_lat, user_lon, 5.0, limit=limit, after=after), donation_record)
         
         return jsonify({
-            "agencies": agencies,
-            "count": len(agencies)
+            "agencies": page.agencies,
+            "count": len(page.agencies),
+            "next_cursor": page.next_cursor
         }), 200
         
     except Exception as e:
@@ -734,37 +676,42 @@ def update_donation():
         """
         
         try:
-            update_response = model.generate_content(update_prompt)
-            update_message = update_response.text.strip()
+            update_message = cached_generate("update", food_list, update_prompt)
         except Exception as e:
             logging.error(f"Gemini update generation error: {e}")
             update_message = f"expect {food_list} here"
         
-        # Get current updates and append new message
+        # One atomic insert; concurrent donors can't overwrite each other's updates
+        created_at = datetime.now()
         conn = get_connection()
         cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO agency_updates (agency_id, message, created_at)
+            SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM agencies WHERE agency_id = ?)
+        """, (agency_id, update_message, created_at, agency_id))
+        inserted = cursor.rowcount
+        update_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
         
-        # Get current updates
-        cursor.execute("SELECT updates FROM agencies WHERE agency_id = ?", (agency_id,))
-        result = cursor.fetchone()
+        if not inserted:
+            return jsonify({"error": "Agency not found"}), 404
         
-        current_updates = result[0] if result and result[0] else ""
+        # Cached searches that show this agency now carry stale updates
+        invalidate_cached_searches(agency_id)
         
-        # Append new update
-        if current_updates:
-            new_updates = current_updates + "; " + update_message
-        else:
-            new_updates = update_message
+        # Streams watching this agency get the update now; other workers' streams via the poller
+        update_feed.publish(update_event(update_id, agency_id, update_message, created_at))
         
-        # Update the database with current timestamp
-        current_time = datetime.now()
-        cursor.execute("UPDATE agencies SET updates = ?, last_update_time = ? WHERE agency_id = ?", (new_updates, current_time, agency_id))
-        conn.commit()
-        conn.close()
+        message = f"Thank you! Your donation of {food_list} has been recorded for this location."
+        if data.get("session_id"):
+            session_id, conversation = conversations.get(data["session_id"])
+            conversation.add("model", message)
+            conversations.save(session_id, conversation)
         
         return jsonify({
             "status": "success",
-            "message": f"Thank you! Your donation of {food_list} has been recorded for this location.",
+            "message": message,
             "update_message": update_message
         }), 200
         
@@ -772,25 +719,174 @@ def update_donation():
         logging.error(f"Update donation error: {e}")
         return jsonify({"error": "Failed to update donation"}), 500
 
-def clear_old_updates():
-    """Clear updates that are older than 2 days"""
+def invalidate_cached_searches(agency_id=None):
+    """Drops cached /search results that include `agency_id`, or every result when it is None."""
+    if agency_id is None:
+        search_cache.clear()
+    else:
+        search_cache.evict_if(lambda page: any(agency["id"] == agency_id for agency in page.agencies))
+
+# (row count, newest id) of agency_updates when this worker's search cache last caught up with it
+_search_cache_synced = None
+
+def sync_search_cache():
+    """
+    Drops this worker's cached searches for agencies that got an update through
+    another worker; the worker that took the POST has already dropped its own.
+    When rows have gone, as after the expiry purge on any worker, every cached
+    result is dropped. Nothing is read while the cache is empty.
+    """
+    global _search_cache_synced
+    if not len(search_cache):
+        return
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        count, newest = cursor.execute("SELECT count(*), coalesce(max(id), 0) FROM agency_updates").fetchone()
+        rows = []
+        if _search_cache_synced is not None and newest > _search_cache_synced[1]:
+            rows = cursor.execute(
+                "SELECT agency_id FROM agency_updates WHERE id > ? AND id <= ?", (_search_cache_synced[1], newest)
+            ).fetchall()
+    # Fewer rows than the new ones account for means some were deleted; the first check
+    # can't tell what the results cached so far have seen either
+    if _search_cache_synced is None or count != _search_cache_synced[0] + len(rows):
+        invalidate_cached_searches()
+    else:
+        for agency_id in {agency_id for agency_id, in rows}:
+            invalidate_cached_searches(agency_id)
+    _search_cache_synced = (count, newest)
+
+def start_search_cache_sync():
+    """Keeps this worker's cached searches in step with updates posted or purged by the other workers."""
+    return start_job("search-cache-sync", sync_search_cache, SEARCH_CACHE_SYNC_INTERVAL)
+
+def update_event(update_id, agency_id, message, created_at):
+    return {"id": update_id, "agency_id": agency_id, "message": message, "created_at": str(created_at)}
+
+def publish_new_updates():
+    """Publishes updates recorded since the last check, including those posted through other workers."""
+    # With no stream open there is nobody to deliver to; stream_updates() sets the position again
+    if update_feed.pause_if_idle() or update_feed.last_id is None:
+        return
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        rows = cursor.execute("""
+            SELECT id, agency_id, message, created_at FROM agency_updates
+            WHERE id > ? ORDER BY id LIMIT 500
+        """, (update_feed.last_id,)).fetchall()
+    for row in rows:
+        update_feed.publish(update_event(*row))
+        update_feed.last_id = row[0]
+
+def start_update_feed():
+    """Polls agency_updates on a background thread so every worker's streams see every update."""
+    return start_job("update-feed", publish_new_updates, FEED_POLL_INTERVAL)
+
+@api_blueprint.route("/updates/stream", methods=["GET"])
+def stream_updates():
+    """
+    Server-sent events with each new donation update for agencies within `radius`
+    miles of `address` (or `lat`/`lng`). Replaces re-running /search to poll.
+    """
+    address = request.args.get("address")
+    lat = request.args.get("lat")
+    lng = request.args.get("lng")
+    try:
+        radius = min(float(request.args.get("radius", 5)), FEED_MAX_RADIUS)
+    except ValueError:
+        return jsonify({"error": "radius must be a number"}), 400
+
+    if address:
+        user_coords = get_lat_lon_by_address(address)
+        if not isinstance(user_coords[0], float):
+            return user_coords  # geocoder error response
+    elif lat and lng:
+        user_coords = (float(lat), float(lng))
+    else:
+        return jsonify({"error": "Address or coordinates are required"}), 400
+
+    agency_ids = list(get_agency_index().within(user_coords[0], user_coords[1], radius))
+    try:
+        subscription = update_feed.subscribe(agency_ids)
+    except FeedFullError as e:
+        logging.warning(f"Update stream refused: {e}")
+        return jsonify({"error": "Too many open update streams, try again later"}), 503
+
+    backlog = []
+    last_event_id = request.headers.get("Last-Event-ID", "")
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        
-        # Calculate timestamp for 2 days ago
-        two_days_ago = datetime.now() - timedelta(days=2)
-        
-        # Clear updates older than 2 days
-        cursor.execute("""
-            UPDATE agencies 
-            SET updates = NULL, last_update_time = NULL 
-            WHERE last_update_time < ?
-        """, (two_days_ago,))
-        
-        rows_affected = cursor.rowcount
-        conn.commit()
+        # The poller stops while a worker has no streams; restart it from the newest update.
+        # Updates after `start` reach this subscription through the poller.
+        start = update_feed.last_id
+        if start is None:
+            start = update_feed.resume_from(
+                cursor.execute("SELECT coalesce(max(id), 0) FROM agency_updates").fetchone()[0]
+            )
+        # Browsers reconnect with the last event they saw; replay what they missed up to `start`
+        if last_event_id.isdigit() and agency_ids:
+            cursor.execute(f"""
+                SELECT id, agency_id, message, created_at FROM agency_updates
+                WHERE agency_id IN ({sql_placeholders(agency_ids)}) AND id > ? AND id <= ?
+                ORDER BY id LIMIT ?
+            """, (*agency_ids, int(last_event_id), start, FEED_BACKLOG_LIMIT))
+            backlog = [update_event(*row) for row in cursor.fetchall()]
         conn.close()
+    except Exception as e:
+        update_feed.unsubscribe(subscription)
+        logging.error(f"Update stream backlog error: {e}")
+        return jsonify({"error": "Failed to open update stream"}), 500
+
+    response = Response(stream_events(update_feed, subscription, backlog), mimetype="text/event-stream")
+    # An unstarted generator never reaches its cleanup, so unsubscribe when the server closes the response too
+    response.call_on_close(lambda: update_feed.unsubscribe(subscription))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
+
+def run_search(query, projection):
+    """Runs a query through the shared search engine and attaches each agency's latest updates."""
+    page = get_search_engine().search(query, projection)
+    if page.agencies:
+        conn = get_connection()
+        cursor = conn.cursor()
+        attach_updates(cursor, {agency["id"]: agency for agency in page.agencies})
+        conn.close()
+    return page
+
+def attach_updates(cursor, agency_map):
+    """Sets each agency's "updates" to its latest unexpired updates, newest first."""
+    if not agency_map:
+        return
+    cursor.execute(f"""
+        SELECT agency_id, message, created_at
+        FROM latest_agency_updates
+        WHERE agency_id IN ({sql_placeholders(agency_map)}) AND recency <= ? AND created_at >= ?
+        ORDER BY agency_id, recency
+    """, (*agency_map, AGENCY_UPDATES_LIMIT, update_cutoff()))
+    for agency_id, message, created_at in cursor.fetchall():
+        agency_map[agency_id]["updates"].append({"message": message, "created_at": str(created_at)})
+
+def update_cutoff():
+    """Updates stamped before this time are expired; searches hide them even before the purge runs."""
+    return datetime.now() - UPDATE_TTL
+
+def clear_old_updates():
+    """Delete updates posted more than 2 days ago"""
+    try:
+        # Runs on the expiry job, outside any request, so the with block is what returns the connection
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Each update expires on its own, 48 hours after it was posted
+            cursor.execute("DELETE FROM agency_updates WHERE created_at < ?", (update_cutoff(),))
+
+            rows_affected = cursor.rowcount
+            conn.commit()
+
+        if rows_affected:
+            invalidate_cached_searches()
         
         logging.info(f"Cleared {rows_affected} old updates")
         return rows_affected
@@ -799,6 +895,14 @@ def clear_old_updates():
         logging.error(f"Error clearing old updates: {e}")
         return 0
 
+def start_update_expiry():
+    """Runs the 48-hour update purge on a background thread instead of on every search, in one worker."""
+    return start_job("update-expiry", clear_old_updates, UPDATE_EXPIRY_INTERVAL, exclusive=True)
+
+def start_chat_session_expiry():
+    """Deletes idle donation chats on a background thread, in one worker."""
+    return start_job("chat-session-expiry", conversations.purge, CHAT_SESSION_PURGE_INTERVAL, exclusive=True)
+
 @api_blueprint.route("/clear-old-updates", methods=["POST"])
 def clear_old_updates_route():
     """Route to manually clear old updates"""
@@ -0,0 +1,76 @@
+import fcntl
+import logging
+import os
+import threading
+
+import config
+
+# Where exclusive jobs keep the lock file that picks the one process running them
+JOB_LOCK_DIR = getattr(config, "JOB_LOCK_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+
+class IntervalJob(threading.Thread):
+    """
+    Daemon thread that calls `func` every `interval` seconds until stopped.
+
+    An exclusive job runs in only one process on the host, for jobs that work
+    on the shared database rather than process memory: every worker starts
+    it, and the first to lock the job's file runs it until that process
+    exits, when another worker takes over.
+    """
+
+    def __init__(self, name, func, interval, run_immediately=True, exclusive=False):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.interval = interval
+        self.run_immediately = run_immediately
+        self.exclusive = exclusive
+        self._lock_file = None
+        self._stopped = threading.Event()
+
+    def run(self):
+        if not self.run_immediately and self._stopped.wait(self.interval):
+            return
+        while True:
+            try:
+                if not self.exclusive or self._lead():
+                    self.func()
+            except Exception as e:
+                # A failed run must not kill the thread; the next interval tries again
+                logging.error(f"Background job {self.name} failed: {e}")
+            if self._stopped.wait(self.interval):
+                return
+
+    def _lead(self):
+        """Whether this process runs the exclusive job, taking the lock if it is free."""
+        if self._lock_file is None:
+            lock_file = open(os.path.join(JOB_LOCK_DIR, f"{self.name}.lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            logging.info(f"Background job {self.name} runs in process {os.getpid()}")
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the lock for another process
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_job(name, func, interval, run_immediately=True, exclusive=False):
+    """Starts a named interval job once per process and returns it."""
+    with _jobs_lock:
+        job = _jobs.get(name)
+        if job is None or not job.is_alive():
+            job = IntervalJob(name, func, interval, run_immediately, exclusive)
+            job.start()
+            _jobs[name] = job
+            logging.info(f"Started background job {name} every {interval}s")
+        return job
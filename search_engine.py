@@ -0,0 +1,415 @@
+"""
+Agency search shared by /search, /expertquery, /vapi_expertquery and /donate/agencies.
+
+Every endpoint asks the same question: which agencies within a radius have an
+opening matching the filters, nearest first. SearchEngine answers it from the
+spatial index and an in-memory catalog of agency_snapshots rows, and a
+projection turns each match into the endpoint's JSON shape. Like the agency
+index, the catalog is loaded once per process and shared read-only by every
+request; restart after re-running data_ingestion.py.
+"""
+import base64
+import heapq
+import json
+import logging
+import sys
+import threading
+from dataclasses import dataclass
+from operator import itemgetter
+
+from database import get_connection
+from distance import HAVERSINE_MAX_ERROR, geodesic_miles
+from migrations import normalize_day
+from spatial_index import get_agency_index
+
+SNAPSHOT_COLUMNS = (
+    "id", "agency_id", "day_of_week", "day_key", "name", "type", "address", "phone", "latitude", "longitude",
+    "start_time", "end_time", "frequency", "distribution_model", "food_format", "appointment_only",
+    "pantry_requirements", "wraparound_services", "cultures_served",
+    "display_name", "display_address", "display_hours",
+)
+
+# Bits of AgencyRecord.flags; culture and service facets take the bits above these
+HOME_DELIVERY = 1
+PREPARED_MEALS = 2
+APPOINTMENT_ONLY = 4
+FACET_SHIFT = 3
+
+ANY_DAY = -1  # day mask with every day bit set
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    lat: float
+    lng: float
+    radius: float = 5.0
+    day: str = None  # any day when None
+    home_delivery: bool = False
+    limit: int = None  # nearest `limit` agencies, or all of them
+    after: tuple = None  # (distance, snapshot id) of the last result on the previous page
+    prepared_meals: bool = False
+    walk_in: bool = False  # only openings that don't need an appointment
+    cultures: tuple = ()  # cultures the agency must serve, all of them
+    services: tuple = ()  # wraparound services the agency must offer, all of them
+
+    @property
+    def day_key(self):
+        return normalize_day(self.day)
+
+
+@dataclass
+class SearchPage:
+    agencies: list
+    next_cursor: str = None  # passed back as `cursor` for the following page; None on the last page
+
+
+def encode_cursor(key):
+    distance, snapshot_id = key
+    return base64.urlsafe_b64encode(f"{distance:.2f}:{snapshot_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(distance, snapshot id) from a cursor; raises ValueError if it wasn't made by encode_cursor."""
+    try:
+        distance, snapshot_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return round(float(distance), 2), int(snapshot_id)
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def facet_key(name):
+    return name.strip().lower()
+
+
+class Facets:
+    """
+    The bits a catalog gives each day key and each culture and service name,
+    handed out as rows are loaded. Queries are compiled against the same
+    assignments, so filtering never looks at the strings again.
+    """
+
+    def __init__(self):
+        self.days = {}  # day_key -> bit
+        self.names = {}  # (column, facet_key(name)) -> bit
+        self._lists = {}  # (column, shared list tuple) -> mask
+
+    def day_bit(self, day_key):
+        bit = self.days.get(day_key)
+        if bit is None:
+            bit = self.days[day_key] = 1 << len(self.days)
+        return bit
+
+    def list_mask(self, column, names):
+        """
+        Bits for a row's cultures_served or wraparound_services, assigning new
+        ones as needed. Some source entries hold several names joined by
+        commas; each name gets its own bit.
+        """
+        mask = self._lists.get((column, names))
+        if mask is None:
+            mask = 0
+            for name in (part for entry in names for part in entry.split(",") if part.strip()):
+                key = (column, facet_key(name))
+                if key not in self.names:
+                    self.names[key] = 1 << (FACET_SHIFT + len(self.names))
+                mask |= self.names[key]
+            self._lists[(column, names)] = mask
+        return mask
+
+    def compile(self, query):
+        """(day mask, flag mask, wanted flags) for a query, or None when no row can match."""
+        day_mask = ANY_DAY if query.day_key is None else self.days.get(query.day_key, 0)
+        want = HOME_DELIVERY if query.home_delivery else 0
+        if query.prepared_meals:
+            want |= PREPARED_MEALS
+        for column, names in (("cultures_served", query.cultures), ("wraparound_services", query.services)):
+            for name in names:
+                bit = self.names.get((column, facet_key(name)))
+                if bit is None:
+                    return None  # no agency lists it
+                want |= bit
+        if not day_mask:
+            return None
+        # Walk-in asks for the appointment bit to be clear: masked, but not wanted
+        return day_mask, want | (APPOINTMENT_ONLY if query.walk_in else 0), want
+
+
+class AgencyRecord:
+    """
+    One agency_snapshots row. Strings are interned, so the day names, models
+    and formats repeated across thousands of rows are stored once, and the
+    JSON lists become tuples shared by every row with the same list.
+
+    The filterable attributes are decoded into two integers when the row is
+    loaded: `day_bit` for its day and `flags` for the delivery, meal and
+    appointment bits plus one bit per culture served and wraparound service.
+    """
+
+    __slots__ = tuple(column for column in SNAPSHOT_COLUMNS if column != "appointment_only") + (
+        "day_bit", "flags"
+    )
+
+    def __init__(self, row, lists, facets):
+        flags = 0
+        for column, value in zip(SNAPSHOT_COLUMNS, row):
+            if column == "appointment_only":
+                flags |= APPOINTMENT_ONLY if value else 0
+                continue
+            if column in ("wraparound_services", "cultures_served"):
+                value = lists.setdefault(value, tuple(json.loads(value or "[]")))
+                flags |= facets.list_mask(column, value)
+            elif isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, column, value)
+        if "Home Delivery" in (self.distribution_model or ""):
+            flags |= HOME_DELIVERY
+        if "Prepared meals" in (self.food_format or ""):
+            flags |= PREPARED_MEALS
+        self.day_bit = facets.day_bit(self.day_key)
+        self.flags = flags
+
+    def matches(self, day_mask, mask, want):
+        return self.day_bit & day_mask and self.flags & mask == want
+
+
+class AgencyCatalog:
+    """
+    Agency records grouped by agency, each agency's rows in id order, with a
+    per-agency summary: the days it opens on and the flags any of its rows
+    carry. The summary rules an agency out without visiting its rows.
+    """
+
+    def __init__(self, records, facets):
+        self.rows = {}
+        self.summary = {}  # agency_id -> (OR of day bits, OR of flags)
+        self.facets = facets
+        for record in records:
+            self.rows.setdefault(record.agency_id, []).append(record)
+            days, flags = self.summary.get(record.agency_id, (0, 0))
+            self.summary[record.agency_id] = (days | record.day_bit, flags | record.flags)
+        self.size = len(records)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds a catalog from database rows in SNAPSHOT_COLUMNS order, sorted by id."""
+        lists = {}  # JSON text -> shared tuple
+        facets = Facets()
+        return cls([AgencyRecord(row, lists, facets) for row in rows], facets)
+
+    def first_match(self, agency_id, day_mask=ANY_DAY, mask=0, want=0):
+        """The agency's first opening matching a Facets.compile() filter, or None."""
+        for record in self.rows.get(agency_id, ()):
+            if record.matches(day_mask, mask, want):
+                return record
+        return None
+
+
+class SearchEngine:
+    def __init__(self, index, catalog):
+        self.index = index
+        self.catalog = catalog
+
+    def search(self, query, projection):
+        """
+        Returns a SearchPage of the matching agencies, nearest first, each
+        projection(record) plus its "distance" and an empty "updates" list.
+
+        Results are ordered by geodesic distance rounded to 2 decimals, then
+        snapshot order, and start after `query.after`. The index's haversine
+        distances only narrow the field: the agencies that can make the page
+        are measured again on the ellipsoid, so distances and order are the
+        ones geopy gives. With a limit the index is searched outward ring by
+        ring and stops once no unsearched agency can make the page, so a dense
+        area never gathers every agency in the radius.
+        """
+        compiled = self.catalog.facets.compile(query)
+        if compiled is None:
+            return SearchPage([])
+
+        exact = {}  # snapshot id -> (geodesic distance, snapshot id), measured once per search
+        if query.limit is None:
+            matches = self._matches(query, compiled, self.index.within(query.lat, query.lng, query.radius))
+            nearest = self._nearest(query, matches, len(matches), exact)
+            return SearchPage([self._project(record, projection, key[0]) for key, record in nearest])
+
+        # One extra match tells whether another page follows
+        wanted = query.limit + 1
+        matches = []
+        for ring, clearance in self.index.rings(query.lat, query.lng, query.radius):
+            matches.extend(self._matches(query, compiled, ring))
+            if len(matches) >= wanted:
+                nearest = self._nearest(query, matches, wanted, exact)
+                # Anything unsearched rounds to a strictly larger distance
+                if len(nearest) == wanted and clearance > nearest[-1][0][0] + 0.01:
+                    break
+
+        nearest = self._nearest(query, matches, wanted, exact)
+        page = nearest[:query.limit]
+        next_cursor = encode_cursor(page[-1][0]) if len(nearest) > query.limit else None
+        return SearchPage([self._project(record, projection, key[0]) for key, record in page], next_cursor)
+
+    def _matches(self, query, compiled, nearby):
+        """(haversine distance, record) for each agency in `nearby` with a matching opening."""
+        day_mask, mask, want = compiled
+        summary = self.catalog.summary
+        matches = []
+        for agency_id, distance in nearby.items():
+            days, flags = summary.get(agency_id, (0, 0))
+            # An agency missing a wanted bit on every row, or closed on every requested day, can't match
+            if not days & day_mask or flags & want != want:
+                continue
+            # Even at the far end of the haversine error it would round to before the cursor
+            if query.after is not None and distance * (1 + HAVERSINE_MAX_ERROR) + 0.01 < query.after[0]:
+                continue
+            record = self.catalog.first_match(agency_id, day_mask, mask, want)
+            if record is not None:
+                matches.append((distance, record))
+        return matches
+
+    @staticmethod
+    def _nearest(query, matches, wanted, exact):
+        """
+        The `wanted` smallest ((distance, snapshot id), record) after `query.after`,
+        with geodesic distances. Matches are measured in haversine order, and
+        only until the rest can't round below the last one kept.
+        """
+        heap = []  # (-distance, -snapshot id, record): the farthest kept is on top
+        for distance, record in sorted(matches, key=itemgetter(0)):
+            if len(heap) == wanted and distance * (1 - HAVERSINE_MAX_ERROR) > 0.01 - heap[0][0]:
+                break
+            key = exact.get(record.id)
+            if key is None:
+                geodesic = geodesic_miles(query.lat, query.lng, record.latitude, record.longitude)
+                key = exact[record.id] = (round(geodesic, 2), record.id)
+            if query.after is not None and key <= query.after:
+                continue
+            item = (-key[0], -key[1], record)
+            if len(heap) < wanted:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+        return sorted((((-d, -i), record) for d, i, record in heap), key=itemgetter(0))
+
+    @staticmethod
+    def _project(record, projection, distance):
+        """The record in the endpoint's shape; built per request, since routes add to it and only a page is built."""
+        agency = projection(record)
+        agency["distance"] = distance
+        agency["updates"] = []
+        return agency
+
+
+# ----------------------------
+# Projections: one per endpoint JSON shape
+# ----------------------------
+
+def clean_name(name):
+    return name.split(':')[1].strip() if ':' in name else name
+
+
+def map_marker(record):
+    """/search: display-ready strings for the map's info windows."""
+    start_time = record.start_time if record.start_time is not None else "N/A"
+    end_time = record.end_time if record.end_time is not None else "N/A"
+
+    # Dealing with address inconsistencies ('Attn:' prefix in some addresses)
+    address = record.address
+    if address and address[:5] == "Attn:":
+        address = address[5:]
+
+    return {
+        "id": record.agency_id,
+        "name": clean_name(record.name),
+        "latitude": record.latitude,
+        "longitude": record.longitude,
+        "phone": record.phone if record.phone else "No phone number available",
+        "day": record.day_of_week if record.day_of_week is not None else "Null",
+        "Prepared_meals": "Available✅" if record.flags & PREPARED_MEALS else "Not available❌",
+        "appointment": "Required⚠️" if record.flags & APPOINTMENT_ONLY else "Not required✅",
+        "home_delivery": "Available✅" if record.flags & HOME_DELIVERY else "Not available❌",
+        "address": address,
+        "hours": start_time[:5] + " - " + end_time[:5],
+    }
+
+
+def expert_record(record):
+    """/expertquery and the Vapi tool: raw fields plus the precomputed voice display strings."""
+    return {
+        "id": record.agency_id,
+        "name": record.name,
+        "type": record.type,
+        "address": record.address,
+        "phone": record.phone,
+        "latitude": record.latitude,
+        "longitude": record.longitude,
+        "day_of_week": record.day_of_week,
+        "start_time": record.start_time,
+        "end_time": record.end_time,
+        "frequency": record.frequency,
+        "distribution_model": record.distribution_model,
+        "food_format": record.food_format,
+        "appointment_only": bool(record.flags & APPOINTMENT_ONLY),
+        "pantry_requirements": record.pantry_requirements,
+        "wraparound_services": record.wraparound_services,
+        "cultures_served": record.cultures_served,
+        "display_name": record.display_name,
+        "display_address": record.display_address,
+        "display_hours": record.display_hours,
+    }
+
+
+def donation_record(record):
+    """/donate/agencies: agencies a donor can pick from."""
+    address = record.address
+    return {
+        "id": record.agency_id,
+        "name": clean_name(record.name),
+        "type": record.type,
+        "address": address.replace("Attn:", "").strip() if address and address.startswith("Attn:") else address,
+        "phone": record.phone if record.phone else "Phone not available",
+        "latitude": record.latitude,
+        "longitude": record.longitude,
+        "day_of_week": record.day_of_week,
+        "start_time": record.start_time,
+        "end_time": record.end_time,
+        "distribution_model": record.distribution_model,
+        "food_format": record.food_format,
+        "appointment_only": bool(record.flags & APPOINTMENT_ONLY),
+        "pantry_requirements": record.pantry_requirements,
+        "wraparound_services": record.wraparound_services,
+        "cultures_served": record.cultures_served,
+    }
+
+
+_search_engine = None
+_search_engine_lock = threading.Lock()
+
+
+def load_agency_catalog():
+    """Reads every agency_snapshots row into a fresh catalog."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM agency_snapshots ORDER BY id")
+        rows = cursor.fetchall()
+
+    catalog = AgencyCatalog.from_rows(rows)
+    logging.info(f"Loaded {catalog.size} agency snapshot rows for {len(catalog.rows)} agencies")
+    return catalog
+
+
+def get_search_engine():
+    """Returns the process-wide search engine, loading the index and catalog on first use."""
+    global _search_engine
+    if _search_engine is None:
+        with _search_engine_lock:
+            if _search_engine is None:
+                _search_engine = SearchEngine(get_agency_index(), load_agency_catalog())
+    return _search_engine
+
+
+def warm_search_engine():
+    """Loads the engine at startup; a failure is retried on the first search instead."""
+    try:
+        get_search_engine()
+    except Exception as e:
+        logging.error(f"Search engine warm-up failed: {e}")
@@ -0,0 +1,61 @@
+"""
+Production launcher: gunicorn with gevent workers.
+
+Each worker process serves requests on greenlets, so time spent waiting on
+Gemini, Google Geocoding, Stripe, Vapi or SQLite Cloud yields to other
+requests instead of pinning a thread. Usage: python serve.py
+
+The database is migrated once, in the arbiter, before any worker starts.
+Each worker still loads its own search engine and runs its own update feed
+and search cache sync, since those serve its in-memory state. The purge jobs
+that only touch the shared database run in one worker at a time; see
+scheduler.IntervalJob.
+
+Environment:
+    PORT                 port to bind (default 5000)
+    WEB_CONCURRENCY      worker processes (default 2 x CPUs + 1)
+    WORKER_CONNECTIONS   concurrent requests per worker (default 500)
+"""
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+def migrate_before_workers(server):
+    # Workers are forked from the arbiter and inherit the migrated flag, so none of them migrates again
+    from migrations import migrate_database
+    migrate_database()
+
+
+def server_options():
+    return {
+        "bind": f"0.0.0.0:{os.getenv('PORT', '5000')}",
+        "workers": int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1)),
+        "worker_class": "gevent",
+        "worker_connections": int(os.getenv("WORKER_CONNECTIONS", 500)),
+        "timeout": 60,
+        "graceful_timeout": 30,
+        "keepalive": 5,
+        "accesslog": "-",
+        "on_starting": migrate_before_workers,
+    }
+
+
+class GeventServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported in each worker after gevent has patched sockets, threads and locks
+        from app import app
+        return app
+
+
+if __name__ == "__main__":
+    GeventServer(server_options()).run()
@@ -0,0 +1,45 @@
+from itertools import islice
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Rows per DataFrame handed to the transforms
+READ_CHUNK_SIZE = 500
+
+
+def _column_names(header):
+    # Same names pd.read_excel gives, including for blank header cells
+    return [f"Unnamed: {i}" if name is None else str(name) for i, name in enumerate(header)]
+
+
+def iter_xlsx_chunks(path, chunksize=READ_CHUNK_SIZE):
+    """Streams the first worksheet of an .xlsx file as DataFrames, without loading the whole workbook."""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _column_names(header)
+        width = len(columns)
+
+        while True:
+            batch = list(islice(rows, chunksize))
+            if not batch:
+                return
+            # Read-only sheets can report short rows and fully blank rows; pandas pads and drops them
+            batch = [
+                (row + (None,) * (width - len(row)))[:width]
+                for row in batch if any(value is not None for value in row)
+            ]
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(path, chunksize=READ_CHUNK_SIZE):
+    """Yields an .xlsx or .csv file as DataFrames of at most `chunksize` rows, named by its header row."""
+    if path.lower().endswith(".csv"):
+        return pd.read_csv(path, chunksize=chunksize)
+    return iter_xlsx_chunks(path, chunksize)
@@ -0,0 +1,219 @@
+import logging
+import math
+import threading
+
+import numpy as np
+
+from database import get_connection
+from distance import EARTH_RADIUS_MILES, HAVERSINE_MAX_ERROR, distances_within
+
+# Conservative (smallest) ground length of one degree of latitude, so the
+# bounding box derived from a radius never cuts off a qualifying agency.
+MILES_PER_DEGREE = 68.7
+
+# Grid cell size in degrees (~3.5 miles of latitude per cell)
+CELL_SIZE_DEGREES = 0.05
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lon, precision=7):
+    """Standard base-32 geohash; 7 characters is a cell of roughly 150 x 150 meters."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def ring_cells(row0, col0, k):
+    """The grid cells exactly k cells away (Chebyshev distance) from (row0, col0)."""
+    if k == 0:
+        return [(row0, col0)]
+    cells = []
+    for col in range(col0 - k, col0 + k + 1):
+        cells.append((row0 - k, col))
+        cells.append((row0 + k, col))
+    for row in range(row0 - k + 1, row0 + k):
+        cells.append((row, col0 - k))
+        cells.append((row, col0 + k))
+    return cells
+
+
+class AgencyIndex:
+    """Grid-bucketed index over agency coordinates used for radius lookups."""
+
+    def __init__(self, ids, lats, lons, cell_size=CELL_SIZE_DEGREES):
+        self.cell_size = cell_size
+        self.ids = list(ids)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.size = len(self.ids)
+
+        # Map each occupied grid cell to the array positions of its agencies
+        buckets = {}
+        rows = np.floor(self.lats / cell_size).astype(int)
+        cols = np.floor(self.lons / cell_size).astype(int)
+        for position, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            buckets.setdefault(cell, []).append(position)
+        self.cells = {cell: np.array(positions) for cell, positions in buckets.items()}
+
+    @classmethod
+    def from_rows(cls, rows, cell_size=CELL_SIZE_DEGREES):
+        """Builds an index from (agency_id, latitude, longitude) rows."""
+        # Agencies that failed geocoding can't be placed on the grid
+        rows = [row for row in rows if row[1] is not None and row[2] is not None]
+        return cls(
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+            cell_size,
+        )
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def bounding_box(self, lat, lon, radius):
+        """Returns (min_lat, max_lat, min_lon, max_lon) enclosing `radius` miles around a point."""
+        dlat = radius / MILES_PER_DEGREE
+        min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        # Longitude degrees shrink towards the poles, so size the box at the widest latitude
+        widest = max(abs(min_lat), abs(max_lat))
+        cos_lat = math.cos(math.radians(widest))
+        if cos_lat < 1e-6:
+            return min_lat, max_lat, -180.0, 180.0
+        dlon = min(radius / (MILES_PER_DEGREE * cos_lat), 180.0)
+        return min_lat, max_lat, lon - dlon, lon + dlon
+
+    def candidates(self, lat, lon, radius):
+        """Array positions of the agencies inside the radius bounding box."""
+        min_lat, max_lat, min_lon, max_lon = self.bounding_box(lat, lon, radius)
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+
+        if (max_row - min_row + 1) * (max_col - min_col + 1) >= len(self.cells):
+            # The box covers more cells than are occupied, so just filter everything
+            positions = np.arange(self.size)
+        else:
+            buckets = [
+                self.cells[(row, col)]
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                if (row, col) in self.cells
+            ]
+            if not buckets:
+                return np.array([], dtype=int)
+            positions = np.concatenate(buckets)
+
+        lats, lons = self.lats[positions], self.lons[positions]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return positions[inside]
+
+    def within(self, lat, lon, radius):
+        """
+        Returns {agency_id: distance_in_miles} for every agency within `radius` miles of the point.
+
+        Distances come from the batched haversine engine, so they are only
+        within HAVERSINE_MAX_ERROR of the geodesic; membership is exact.
+        """
+        positions = self.candidates(lat, lon, radius)
+        if not len(positions):
+            return {}
+
+        lats, lons = self.lats[positions], self.lons[positions]
+        hits, distances = distances_within(lat, lon, lats, lons, radius)
+
+        return {self.ids[p]: d for p, d in zip(positions[hits].tolist(), distances.tolist())}
+
+    def rings(self, lat, lon, radius):
+        """
+        Yields ({agency_id: distance_in_miles}, clearance) for the agencies within `radius`
+        miles, one ring of grid cells at a time outward from the point's cell.
+
+        Every agency not yet yielded is more than `clearance` miles away, so a
+        k-nearest search can stop as soon as its k-th distance is below it.
+        """
+        min_lat, max_lat, min_lon, max_lon = self.bounding_box(lat, lon, radius)
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+        row0, col0 = self._cell(lat, lon)
+
+        if (max_row - min_row + 1) * (max_col - min_col + 1) >= len(self.cells):
+            # The box covers more cells than are occupied, so group the occupied ones by ring
+            # instead of walking every empty ring out to the radius
+            by_ring = {}
+            for row, col in self.cells:
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    by_ring.setdefault(max(abs(row - row0), abs(col - col0)), []).append(self.cells[(row, col)])
+            steps = sorted(by_ring.items())
+        else:
+            last = max(row0 - min_row, max_row - row0, col0 - min_col, max_col - col0)
+            steps = (
+                (k, [
+                    self.cells[(row, col)]
+                    for row, col in ring_cells(row0, col0, k)
+                    if min_row <= row <= max_row and min_col <= col <= max_col and (row, col) in self.cells
+                ])
+                for k in range(last + 1)
+            )
+
+        # Skipped rings are empty, so each clearance still bounds everything not yet yielded
+        for k, buckets in steps:
+            found = {}
+            if buckets:
+                positions = np.concatenate(buckets)
+                hits, distances = distances_within(lat, lon, self.lats[positions], self.lons[positions], radius)
+                found = {self.ids[p]: d for p, d in zip(positions[hits].tolist(), distances.tolist())}
+            yield found, self._clearance(lat, lon, row0, col0, k)
+
+    def _clearance(self, lat, lon, row0, col0, k):
+        """Lower bound in miles on the distance from the point to anything outside rings 0..k."""
+        size = self.cell_size
+        # Degrees of latitude and longitude to the nearest edge of the searched block of cells
+        dlat = min(lat - (row0 - k) * size, (row0 + k + 1) * size - lat)
+        dlon = min(lon - (col0 - k) * size, (col0 + k + 1) * size - lon)
+        # Great-circle distance to the nearest meridian beyond dlon; it shrinks with latitude
+        across = math.asin(min(math.cos(math.radians(lat)) * math.sin(math.radians(min(dlon, 90.0))), 1.0))
+        angle = min(math.radians(dlat), across)
+        # Allow for distances that were re-measured on the ellipsoid
+        return angle * EARTH_RADIUS_MILES * (1 - HAVERSINE_MAX_ERROR)
+
+
+_agency_index = None
+_agency_index_lock = threading.Lock()
+
+
+def load_agency_index():
+    """Reads agency coordinates from the database and builds a fresh index."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT agency_id, latitude, longitude FROM agencies")
+        rows = cursor.fetchall()
+
+    index = AgencyIndex.from_rows(rows)
+    logging.info(f"Built agency index with {index.size} agencies in {len(index.cells)} cells")
+    return index
+
+
+def get_agency_index():
+    """Returns the process-wide agency index, building it on first use."""
+    global _agency_index
+    if _agency_index is None:
+        with _agency_index_lock:
+            if _agency_index is None:
+                _agency_index = load_agency_index()
+    return _agency_index
@@ -0,0 +1,164 @@
+"""
+/search's day and home-delivery filters, checked against the Python filter
+search_agencies() used before the filtering moved out of the request loop.
+"""
+import random
+import sqlite3
+from functools import lru_cache
+
+import pytest
+from geopy.distance import geodesic
+
+from migrations import migrate
+from search_engine import SNAPSHOT_COLUMNS, AgencyCatalog, SearchEngine, SearchQuery, decode_cursor, map_marker
+from spatial_index import AgencyIndex
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday", "As Needed"]
+MODELS = ["Home Delivery", "Pantry", "Pantry, Home Delivery", "Drive-thru", "home delivery", None]
+FORMATS = ["Prepared meals", "Groceries", "Groceries, Prepared meals", None]
+ORIGINS = [(38.9, -77.0), (38.8, -77.2), (39.05, -76.85)]
+RADII = [1, 3, 10, 25]
+
+
+@pytest.fixture(scope="module")
+def db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE agencies (
+            id INTEGER PRIMARY KEY, agency_id VARCHAR NOT NULL, name VARCHAR NOT NULL, type VARCHAR NOT NULL,
+            address VARCHAR, phone VARCHAR, latitude FLOAT, longitude FLOAT
+        );
+        CREATE TABLE hours_of_operation (
+            id INTEGER PRIMARY KEY, agency_id VARCHAR, day_of_week VARCHAR, start_time TIME, end_time TIME,
+            frequency VARCHAR, distribution_model VARCHAR, food_format VARCHAR, appointment_only BOOLEAN,
+            pantry_requirements VARCHAR
+        );
+        CREATE TABLE wraparound_services (id INTEGER PRIMARY KEY, agency_id VARCHAR, service VARCHAR);
+        CREATE TABLE cultures_served (id INTEGER PRIMARY KEY, agency_id VARCHAR, cultures VARCHAR);
+    """)
+
+    rng = random.Random(14)
+    for n in range(300):
+        agency_id = f"A{n:03d}"
+        name = f"Partner: Pantry {n}" if n % 3 else f"Pantry {n}"
+        address = f"Attn: {n} Main St" if n % 7 == 0 else f"{n} Main St"
+        conn.execute(
+            "INSERT INTO agencies (agency_id, name, type, address, phone, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (agency_id, name, "market", address, None if n % 5 == 0 else "202-555-0100",
+             38.9 + rng.uniform(-0.4, 0.4), -77.0 + rng.uniform(-0.4, 0.4))
+        )
+        for _ in range(rng.randint(1, 5)):
+            conn.execute(
+                "INSERT INTO hours_of_operation (agency_id, day_of_week, start_time, end_time, distribution_model, "
+                "food_format, appointment_only) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (agency_id, rng.choice(DAYS), rng.choice(["09:00:00", "13:30:00", None]),
+                 rng.choice(["12:00:00", "17:00:00", None]), rng.choice(MODELS), rng.choice(FORMATS),
+                 rng.choice([0, 1, None]))
+            )
+        if n % 4 == 0:
+            conn.execute("INSERT INTO wraparound_services (agency_id, service) VALUES (?, ?)", (agency_id, "SNAP"))
+            conn.execute("INSERT INTO cultures_served (agency_id, cultures) VALUES (?, ?)", (agency_id, "Latin American"))
+    conn.commit()
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def engine(db):
+    index = AgencyIndex.from_rows(db.execute("SELECT agency_id, latitude, longitude FROM agencies").fetchall())
+    catalog = AgencyCatalog.from_rows(
+        db.execute(f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM agency_snapshots ORDER BY id").fetchall()
+    )
+    return SearchEngine(index, catalog)
+
+
+@lru_cache(maxsize=None)
+def miles(user_coords, agency_coords):
+    return geodesic(user_coords, agency_coords).miles
+
+
+def old_search(db, user_coords, radius, day, home_delivery):
+    """The loop search_agencies() ran over every opening before its filters moved out of Python."""
+    rows = db.execute("""
+        SELECT a.agency_id, a.name, a.address, a.phone, a.latitude, a.longitude,
+               h.day_of_week, h.start_time, h.end_time, h.distribution_model, h.food_format, h.appointment_only
+        FROM agencies a
+        JOIN hours_of_operation h ON a.agency_id = h.agency_id
+        LEFT JOIN wraparound_services w ON a.agency_id = w.agency_id
+        LEFT JOIN cultures_served c ON a.agency_id = c.agency_id
+        ORDER BY a.id, h.id
+    """).fetchall()
+
+    agency_map = {}
+    for agency_id, name, address, phone, latitude, longitude, day_of_week, start_time, end_time, distribution, \
+            food_format, appointment in rows:
+        distance = miles(user_coords, (latitude, longitude))
+        if day_of_week is None:
+            day_of_week = "Null"
+        if distance > radius or day_of_week.lower() != day.lower() or agency_id in agency_map:
+            continue
+        distribution = distribution or "N/A"
+        if home_delivery and "Home Delivery" not in distribution:
+            continue
+        start_time = start_time or "N/A"
+        end_time = end_time or "N/A"
+        if address and address[:5] == "Attn:":
+            address = address[5:]
+        agency_map[agency_id] = {
+            "id": agency_id,
+            "name": name.split(':')[1].strip() if ':' in name else name,
+            "latitude": latitude,
+            "longitude": longitude,
+            "distance": round(distance, 2),
+            "phone": phone if phone else "No phone number available",
+            "day": day_of_week,
+            "Prepared_meals": "Available✅" if "Prepared meals" in (food_format or "N/A") else "Not available❌",
+            "appointment": "Required⚠️" if appointment == 1 else "Not required✅",
+            "home_delivery": "Available✅" if "Home Delivery" in distribution else "Not available❌",
+            "address": address,
+            "hours": start_time[:5] + " - " + end_time[:5],
+        }
+
+    return sorted(agency_map.values(), key=lambda agency: agency["distance"])
+
+
+def without_updates(agencies):
+    return [{key: value for key, value in agency.items() if key != "updates"} for agency in agencies]
+
+
+@pytest.mark.parametrize("home_delivery", [False, True])
+@pytest.mark.parametrize("day", DAYS + ["saturday", "SUNDAY"])
+def test_search_matches_old_filter(db, engine, day, home_delivery):
+    for lat, lng in ORIGINS:
+        for radius in RADII:
+            expected = old_search(db, (lat, lng), radius, day, home_delivery)
+            page = engine.search(SearchQuery(lat, lng, radius, day, home_delivery), map_marker)
+            assert without_updates(page.agencies) == expected, (lat, lng, radius)
+            assert page.next_cursor is None
+
+
+@pytest.mark.parametrize("home_delivery", [False, True])
+@pytest.mark.parametrize("day", ["Monday", "As Needed", None])
+def test_pages_join_up_to_full_results(engine, day, home_delivery):
+    for lat, lng in ORIGINS:
+        for radius in RADII:
+            full = engine.search(SearchQuery(lat, lng, radius, day, home_delivery), map_marker).agencies
+            walked, after = [], None
+            while True:
+                page = engine.search(SearchQuery(lat, lng, radius, day, home_delivery, 7, after), map_marker)
+                walked.extend(page.agencies)
+                if page.next_cursor is None:
+                    break
+                after = decode_cursor(page.next_cursor)
+            assert walked == full, (lat, lng, radius)
+
+
+def test_wide_radius_limit_with_rare_filter_visits_only_occupied_cells(engine):
+    # Few openings match, so the page never fills and the search runs out to the radius
+    query = dict(lat=38.9, lng=-77.0, radius=5000, day="Sunday", home_delivery=True, prepared_meals=True)
+    assert sum(1 for _ in engine.index.rings(38.9, -77.0, 5000)) <= len(engine.index.cells)
+
+    full = engine.search(SearchQuery(**query), map_marker).agencies
+    page = engine.search(SearchQuery(limit=len(full) + 5, **query), map_marker)
+    assert 0 < len(full) and page.agencies == full and page.next_cursor is None
@@ -0,0 +1,175 @@
+"""
+In-process pub/sub for donation updates, streamed to browsers as server-sent events.
+
+Each subscriber watches a fixed set of agencies (those in the area it asked
+for) and gets a bounded queue. A client that stops reading fills its queue and
+is sent a "resync" event and disconnected instead of letting the queue grow;
+the browser reconnects with its Last-Event-ID and is replayed what it missed.
+Updates are published here by the worker that recorded them
+and picked up from the agency_updates table by every other worker. A worker
+with no open streams stops reading the table; the next stream it accepts
+restarts the poll from the newest update.
+"""
+import json
+import queue
+import threading
+from collections import deque
+
+import config
+
+FEED_MAX_SUBSCRIBERS = getattr(config, "FEED_MAX_SUBSCRIBERS", 1000)  # open streams per worker
+FEED_QUEUE_SIZE = getattr(config, "FEED_QUEUE_SIZE", 100)  # undelivered events held per client
+FEED_HEARTBEAT = getattr(config, "FEED_HEARTBEAT", 15)  # seconds between keep-alive comments
+FEED_POLL_INTERVAL = getattr(config, "FEED_POLL_INTERVAL", 2)  # seconds between checks for other workers' updates
+FEED_RETRY_MS = getattr(config, "FEED_RETRY_MS", 5000)  # browser reconnect delay
+
+# Event IDs remembered so an update published locally isn't delivered again by the poller
+RECENT_EVENT_IDS = 4096
+
+
+class FeedFullError(Exception):
+    pass
+
+
+class Subscription:
+    """One client's stream: the agencies it watches and its bounded event queue."""
+
+    def __init__(self, agency_ids, maxsize=FEED_QUEUE_SIZE):
+        self.agency_ids = frozenset(agency_ids)
+        self.events = queue.Queue(maxsize=maxsize)
+        self.lagged = False  # set once an event had to be dropped
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, event):
+        """Queues an event without blocking the publisher; a full queue marks the client as lagged."""
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.lagged = True
+            self.dropped += 1
+
+    def next(self, timeout=FEED_HEARTBEAT):
+        """The next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class UpdateFeed:
+    """Routes published updates to the subscribers watching their agency."""
+
+    def __init__(self, max_subscribers=FEED_MAX_SUBSCRIBERS, queue_size=FEED_QUEUE_SIZE):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.last_id = None  # highest agency_updates id seen by the poller; None while no stream is open
+        self.published = 0
+        self.disconnected_slow = 0
+        self._by_agency = {}  # agency_id -> set of Subscription
+        self._subscribers = 0
+        self._recent = deque()
+        self._recent_ids = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, agency_ids):
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                raise FeedFullError(f"{self._subscribers} update streams already open")
+            subscription = Subscription(agency_ids, self.queue_size)
+            for agency_id in subscription.agency_ids:
+                self._by_agency.setdefault(agency_id, set()).add(subscription)
+            self._subscribers += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Removes a subscription; safe to call more than once."""
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            for agency_id in subscription.agency_ids:
+                watchers = self._by_agency.get(agency_id)
+                if watchers is not None:
+                    watchers.discard(subscription)
+                    if not watchers:
+                        del self._by_agency[agency_id]
+            self._subscribers -= 1
+            self.disconnected_slow += subscription.lagged
+
+    def pause_if_idle(self):
+        """Forgets the poll position if nobody is subscribed; returns whether the poll can be skipped."""
+        with self._lock:
+            if self._subscribers:
+                return False
+            self.last_id = None
+            return True
+
+    def resume_from(self, last_id):
+        """Sets the poll position after an idle spell; a position another stream already set is kept."""
+        with self._lock:
+            if self.last_id is None:
+                self.last_id = last_id
+            return self.last_id
+
+    def publish(self, event):
+        """Delivers an update dict (id, agency_id, message, created_at) once; returns how many clients got it."""
+        with self._lock:
+            if event["id"] in self._recent_ids:
+                return 0
+            self._recent.append(event["id"])
+            self._recent_ids.add(event["id"])
+            if len(self._recent) > RECENT_EVENT_IDS:
+                self._recent_ids.discard(self._recent.popleft())
+            watchers = list(self._by_agency.get(event["agency_id"], ()))
+            self.published += 1
+
+        # Offered outside the lock; put_nowait never waits on a slow client
+        for subscription in watchers:
+            subscription.offer(event)
+        return len(watchers)
+
+    def stats(self):
+        return {
+            "subscribers": self._subscribers,
+            "agencies_watched": len(self._by_agency),
+            "published": self.published,
+            "disconnected_slow": self.disconnected_slow,
+        }
+
+
+def format_event(data, event=None, event_id=None):
+    """One server-sent event frame."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_events(feed, subscription, backlog=(), heartbeat=FEED_HEARTBEAT):
+    """
+    Yields SSE frames for a subscription until the client disconnects or falls behind.
+
+    `backlog` holds updates missed since the client's Last-Event-ID. A lagged
+    client gets a "resync" event and the stream ends.
+    """
+    try:
+        yield f"retry: {FEED_RETRY_MS}\n\n"
+        for update in backlog:
+            yield format_event(update, "update", update["id"])
+        while True:
+            update = subscription.next(heartbeat)
+            if subscription.lagged:
+                yield format_event({"dropped": subscription.dropped}, "resync")
+                return
+            if update is None:
+                # Comment line; keeps proxies from closing the idle connection
+                yield ": keep-alive\n\n"
+            else:
+                yield format_event(update, "update", update["id"])
+    finally:
+        # Runs when the server closes the generator after the client goes away
+        feed.unsubscribe(subscription)
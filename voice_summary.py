@@ -0,0 +1,100 @@
+"""
+Spoken summaries of food sites for the Vapi tool call.
+
+Display strings (cleaned names and addresses, 12-hour opening times) are
+computed once when agency_snapshots rows are written, so rendering a summary
+only joins precomputed phrases. Summaries cover the nearest `top_k` sites and
+are produced in chunks, one per sentence group.
+
+Kept free of config and app imports so migrations.py can use it.
+"""
+import heapq
+import logging
+from datetime import time
+
+
+def format_time_12hr(value):
+    """"13:30:00.000000" or a time -> "1:30 PM"; None if it can't be read."""
+    if not value:
+        return None
+    if isinstance(value, time):
+        hour, minute = value.hour, value.minute
+    else:
+        try:
+            hour, minute = int(value[:2]), int(value[3:5])
+        except (TypeError, ValueError):
+            logging.error(f"Time formatting error: {value!r}")
+            return None
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def display_name(name):
+    """Drops the "Program:" style prefix some agency names carry."""
+    return name.split(':')[1].strip() if ':' in name else name
+
+
+def display_address(address):
+    return address.replace("Attn:", "").strip() if address else address
+
+
+def display_hours(start_time, end_time):
+    """"9:00 AM to 11:00 AM", or None when either end is unknown."""
+    start, end = format_time_12hr(start_time), format_time_12hr(end_time)
+    return f"{start} to {end}" if start and end else None
+
+
+def display_columns(name, address, start_time, end_time):
+    """The display_* values stored alongside each agency_snapshots row."""
+    return {
+        "display_name": display_name(name),
+        "display_address": display_address(address),
+        "display_hours": display_hours(start_time, end_time),
+    }
+
+
+def site_sentence(agency):
+    """The spoken description of one site, from a fetch_filtered_agencies() record."""
+    hours = agency.get("display_hours")
+    time_phrase = f"open from {hours}" if hours else "operating hours are currently not available"
+    appointment = "Appointments are required" if agency.get("appointment_only") else "Walk-ins are welcome"
+
+    extras = []
+    if agency.get("distance"):
+        extras.append(f"It's about {agency['distance']} miles away.")
+    if agency.get("distribution_model"):
+        extras.append(f"It's a {agency['distribution_model'].lower()} site.")
+    if agency.get("food_format"):
+        extras.append(f"They offer {agency['food_format'].lower()}.")
+    if agency.get("frequency"):
+        extras.append(f"This site operates {agency['frequency'].lower()}.")
+    if agency.get("pantry_requirements"):
+        extras.append("You may need an ID or meet other requirements.")
+    if agency.get("cultures_served"):
+        extras.append(f"This site serves communities including {', '.join(agency['cultures_served'])}.")
+    if agency.get("wraparound_services"):
+        extras.append("Wraparound services are also available.")
+    if agency.get("phone"):
+        extras.append(f"If you have questions, you can call them at {agency['phone']}.")
+
+    return (f"{agency['display_name']}, located at {agency['display_address']}, is {time_phrase}. "
+            f"{appointment}. {' '.join(extras)}. ")
+
+
+def iter_voice_summary(agencies, day_of_week, top_k=5, more=False):
+    """
+    Yields the summary a sentence group at a time: the overview, each of the nearest sites, the closing question.
+
+    `more` says there are further sites beyond `agencies`, for callers that only fetched the nearest few.
+    """
+    if not agencies:
+        yield f"I couldn't find any food sites open on {day_of_week}. Would you like to try a different day?"
+        return
+
+    count = f"more than {len(agencies)}" if more else len(agencies)
+    yield f"I found {count} food site{'s' if more or len(agencies) > 1 else ''} near you for {day_of_week}. "
+    nearest = heapq.nsmallest(top_k, agencies, key=lambda agency: agency["distance"])
+    if more or len(agencies) > len(nearest):
+        yield f"Here are the {len(nearest)} closest. "
+    for agency in nearest:
+        yield site_sentence(agency)
+    yield "Would you like directions or to hear more options?"
@@ -0,0 +1,50 @@
+import csv
+import logging
+import os
+import re
+import threading
+
+# Bundled ZIP code -> (latitude, longitude) centroids for the whole US, from the
+# MIT-licensed zipcodes package; see data/LICENSE-zipcodes
+ZIP_CENTROIDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "zip_centroids.csv")
+
+ZIP_CODE_RE = re.compile(r"^\s*(\d{5})(?:-\d{4})?\s*$")
+
+_centroids = None
+_centroids_lock = threading.Lock()
+
+
+def load_zip_centroids(path=ZIP_CENTROIDS_PATH):
+    centroids = {}
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        for zip_code, lat, lon in reader:
+            centroids[zip_code] = (float(lat), float(lon))
+    logging.info(f"Loaded {len(centroids)} ZIP code centroids")
+    return centroids
+
+
+def get_zip_centroids():
+    """Returns the centroid table, reading the bundled file on first use."""
+    global _centroids
+    if _centroids is None:
+        with _centroids_lock:
+            if _centroids is None:
+                try:
+                    _centroids = load_zip_centroids()
+                except (OSError, ValueError) as e:
+                    # Without the table every lookup simply falls through to the network
+                    logging.error(f"Could not load ZIP centroids: {e}")
+                    _centroids = {}
+    return _centroids
+
+
+def lookup_zip(query):
+    """Returns (lat, lon) when `query` is a known 5-digit (or ZIP+4) code, otherwise None."""
+    if not query:
+        return None
+    match = ZIP_CODE_RE.match(str(query))
+    if not match:
+        return None
+    return get_zip_centroids().get(match.group(1))